@@ -0,0 +1,156 @@
+"""
+module for array-backed snapshot of SSR orbit/clock corrections
+
+The snapshot holds the corrections used to generate the SP3/SSR products
+while the decoder continues with the next epoch.  The corrections are kept
+in arrays indexed by sat-1, so that a snapshot is taken by a few array
+copies instead of deepcopy() of the per-satellite dictionaries.  The
+parameters (satellite list, IODs, navigation mode) hold scalars only and
+are copied shallow.
+"""
+
+from copy import copy
+import numpy as np
+from B2b_HAS_decoder.gnss import uGNSS, sat2prn
+from B2b_HAS_decoder.cssrlib import sCType, sat_array, local_corr_array
+from B2b_HAS_decoder.ephemeris import findeph
+
+# validity bits of the corrections
+SNAP_IODE = 0x1  # IODE of broadcast ephemeris
+SNAP_ORBIT = 0x2  # orbit correction
+SNAP_CLOCK = 0x4  # clock correction
+
+# column of reference time t0 for correction type
+T0_IDX = {sCType.ORBIT: 0, sCType.CLOCK: 1}
+
+
+def gtime2sec(t):
+    """ gtime_t to seconds """
+    return t.time + t.sec
+
+
+class corr_snapshot:
+    """ class for snapshot of SSR orbit/clock corrections """
+
+    def __init__(self):
+        self.init_empty()
+
+    def init_empty(self):
+        self.cssrmode = None
+        self.sat_n = []
+        self.iodssr = None
+        self.iodssr_c = {}
+        self.nav_mode = {}
+        self.subtype = None
+        self.mask_id = None
+        self.mask_id_clk = None
+        self.sat_n_p = None
+
+        n = uGNSS.MAXSAT
+        self.stat = np.zeros(n, dtype='uint8')  # validity bits
+        self.iode = np.zeros(n, dtype='int32')
+        self.iodc = np.zeros(n, dtype='int32')
+        self.iodc_c = np.zeros(n, dtype='int32')
+        self.dorb = np.full((n, 3), np.nan)  # radial,along-track,cross-track
+        self.dclk = np.full(n, np.nan)
+        self.t0 = np.full((n, 2), np.nan)  # reference time of orbit, clock
+
+    def copy_param(self, src):
+        """ copy the parameters of the corrections from src """
+        self.cssrmode = getattr(src, 'cssrmode', None)
+        self.sat_n = copy(getattr(src, 'sat_n', []))
+        self.iodssr = getattr(src, 'iodssr', None)
+        self.iodssr_c = copy(getattr(src, 'iodssr_c', {}))
+        self.nav_mode = copy(getattr(src, 'nav_mode', {}))
+        self.subtype = getattr(src, 'subtype', None)
+        self.mask_id = getattr(src, 'mask_id', None)
+        self.mask_id_clk = getattr(src, 'mask_id_clk', None)
+        self.sat_n_p = copy(getattr(src, 'sat_n_p', None))
+
+    def copy_from(self, src):
+        """ copy all corrections from other snapshot """
+        self.copy_param(src)
+        for k in ('stat', 'iode', 'iodc', 'iodc_c', 'dorb', 'dclk', 't0'):
+            np.copyto(getattr(self, k), getattr(src, k))
+
+    def set_iode(self, iode):
+        """ set IODE of all satellites from dict {sat: iode} or sat_array """
+        if isinstance(iode, sat_array):
+            np.copyto(self.iode, iode.val)
+            self.stat[:] = (self.stat & ~np.uint8(SNAP_IODE)) | \
+                (iode.mask * np.uint8(SNAP_IODE))
+            return
+        self.stat &= ~np.uint8(SNAP_IODE)
+        self.iode[:] = 0
+        if len(iode) > 0:
+            idx = np.fromiter(iode.keys(), dtype=int, count=len(iode)) - 1
+            self.iode[idx] = np.fromiter(iode.values(), dtype=int, count=len(iode))
+            self.stat[idx] |= SNAP_IODE
+
+    def set_orbit(self, sats, lc):
+        """ set orbit corrections of satellites from local_corr """
+        if len(sats) == 0:
+            return
+        idx = np.array(sats) - 1
+        if isinstance(lc, local_corr_array):
+            self.iode[idx] = lc.iode.val[idx]
+            self.iodc[idx] = lc.iodc.val[idx]
+            self.dorb[idx] = lc.dorb.val[idx]
+            self.t0[idx, 0] = lc.t0.val[idx, sCType.ORBIT]
+        else:
+            self.iode[idx] = [lc.iode[sat] for sat in sats]
+            iodc = getattr(lc, 'iodc', None)  # BDS only
+            if iodc is not None:
+                self.iodc[idx] = [iodc[sat] for sat in sats]
+            self.dorb[idx] = [lc.dorb[sat] for sat in sats]
+            self.t0[idx, 0] = [gtime2sec(lc.t0[sat][sCType.ORBIT]) for sat in sats]
+        self.stat[idx] |= SNAP_ORBIT | SNAP_IODE
+
+    def set_clock(self, sats, lc):
+        """ set clock corrections of satellites from local_corr """
+        if len(sats) == 0:
+            return
+        idx = np.array(sats) - 1
+        if isinstance(lc, local_corr_array):
+            self.dclk[idx] = lc.dclk.val[idx]
+            self.iodc_c[idx] = lc.iodc_c.val[idx]
+            self.t0[idx, 1] = lc.t0.val[idx, sCType.CLOCK]
+        else:
+            self.dclk[idx] = [lc.dclk[sat] for sat in sats]
+            iodc_c = getattr(lc, 'iodc_c', None)  # BDS only
+            if iodc_c is not None:
+                self.iodc_c[idx] = [iodc_c[sat] for sat in sats]
+            self.t0[idx, 1] = [gtime2sec(lc.t0[sat][sCType.CLOCK]) for sat in sats]
+        self.stat[idx] |= SNAP_CLOCK
+
+    def timediff(self, t, sat, ctype):
+        """ time difference of t from the reference time of correction """
+        return gtime2sec(t) - self.t0[sat-1, T0_IDX[ctype]]
+
+    def find_ephs(self, nav, t, systems):
+        """
+        find broadcast ephemeris matching IODE of each satellite of sat_n
+
+        Returns the list of Eph for eph2pos_batch(), None for the satellites
+        without valid orbit/clock corrections or ephemeris.
+        """
+        ephs = [None]*len(self.sat_n)
+        for j, sat in enumerate(self.sat_n):
+            sys, _ = sat2prn(sat)
+            if sys not in systems or sys not in self.nav_mode.keys():
+                continue
+            if np.isnan(self.dclk[sat-1]) or np.isnan(self.dorb[sat-1]@self.dorb[sat-1]):
+                continue
+            ephs[j] = findeph(nav, t, sat, iode=self.iode[sat-1],
+                              mode=self.nav_mode[sys])
+        return ephs
+
+    def deletePRN(self, sat):
+        i = sat - 1
+        self.stat[i] &= ~np.uint8(SNAP_ORBIT | SNAP_CLOCK)
+        self.iode[i] = 0
+        self.iodc[i] = 0
+        self.iodc_c[i] = 0
+        self.dorb[i] = np.nan
+        self.dclk[i] = np.nan
+        self.t0[i] = np.nan
@@ -7,10 +7,12 @@ Precise Point Positioning Service Signal PPP-B2b (Version 1.0), 2020
 
 import numpy as np
 import bitstruct as bs
-from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sGNSS, prn2sat, sCType
+from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sGNSS, prn2sat, sCType, local_corr_array
 from B2b_HAS_decoder.gnss import bdt2time, bdt2gpst, uGNSS, uSIG, uTYP, rSigRnx,sat2prn,time2str,sat2id,time2epoch,timediff,vnorm,rCST
-from B2b_HAS_decoder.ephemeris import eph2pos, findeph,eph2rel
+from B2b_HAS_decoder.ephemeris import eph_cache
+from B2b_HAS_decoder.ssr_writer import ssr_writer
 from B2b_HAS_decoder.peph import peph,peph_t
+from B2b_HAS_decoder.corr_snapshot import SNAP_IODE, SNAP_ORBIT
 
 
 max_orbit_delay=300
@@ -26,6 +28,18 @@ class cssr_bds(cssr):
         self.iodp_p = -1
         self.cb_blen = 12
         self.cb_scl = 0.017
+        # orbit/clock corrections in arrays indexed by sat-1
+        self.lc = []
+        for inet in range(self.MAXNET+1):
+            self.lc.append(local_corr_array())
+            self.lc[inet].inet = inet
+            self.lc[inet].flg_trop = 0
+            self.lc[inet].flg_stec = 0
+            self.lc[inet].nsat_n = 0
+        # table rows of broadcast ephemerides used by encode_SP3()
+        self.eph_cache = eph_cache()
+        # buffered writer of the .ssr files of encode_SP3()
+        self.ssr_out = ssr_writer()
 
     def ssig2rsig(self, sys: sGNSS, utyp: uTYP, ssig):
         gps_tbl = {
@@ -167,19 +181,11 @@ class cssr_bds(cssr):
 
             # 这里是针对每颗卫星进行存储器轨道、钟差的改正数变量进行初始化
             inet = 0
-            self.lc[inet].dclk = {}
-            self.lc[inet].dorb = {}
-            self.lc[inet].iode = {}
-            self.lc[inet].iodc = {}
-            self.lc[inet].iodc_c = {}
-            self.lc[inet].cbias = {}
+            self.lc[inet].init_corr()
             self.nsig_n = np.ones(self.nsat_n, dtype=int)*self.nsig_max
             self.sig_n = {}
             self.ura = {}
 
-            # fallback for inconsistent clock update
-            self.lc[inet].dclk_p = {}
-            self.lc[inet].iodc_c_p = {}
             msg="Change of IODP in decode_cssr_mask"
             self.log_msg(msg)
         # 这里存储的是对应于参数解码中的IOD SSR (SSR版本号）
@@ -327,14 +333,21 @@ class cssr_bds(cssr):
         # 卫星钟差改正：     self.lc[inet].dclk[sat] =
         # 这颗卫星的时间，   self.lc[inet].t0[sat][sCType.CLOCK] = self.time 这里分别保存了每一种参数的时间
         # 钟差的iod_ssr:   self.iodssr_c[sCType.CLOCK] = head['iodssr']
-        for k in range(23):
-            idx = st1*23+k
-            if idx < self.nsat_n:
-                sat = self.sat_n[idx]
-                i = self.decode_cssr_clk_sat(msg, i, inet, sat)
-                if sat not in self.lc[inet].t0:
-                    self.lc[inet].t0[sat] = {}
-                self.lc[inet].t0[sat][sCType.CLOCK] = self.time
+        sats = self.sat_n[st1*23:min(st1*23+23, self.nsat_n)]
+        n = len(sats)
+        v = bs.unpack_from('u3s{:d}'.format(self.dclk_blen)*n, msg, i)
+        i += n*(3+self.dclk_blen)
+        iodc = np.array(v[0::2], dtype=int)
+        # note: the sign of the clock correction reversed
+        dclk = -np.array([self.sval(u, self.dclk_blen, self.dclk_scl)
+                          for u in v[1::2]], dtype=float)
+        if n > 0:
+            self.lc[inet].set_clk(sats, iodc, dclk, self.time)
+        if self.monlevel > 0 and self.fh is not None:
+            str_time = time2str(self.time)
+            for sat, iodc_, dclk_ in zip(sats, iodc, dclk):
+                if ~np.isnan(dclk_):
+                    self.log_msg('cssr_clk_sat: %s %s %d %.3f ' % (sat2id(sat), str_time, iodc_, dclk_))
 
         self.iodssr_c[sCType.CLOCK] = head['iodssr']
         self.lc[inet].cstat |= (1 << sCType.CLOCK)
@@ -621,6 +634,9 @@ class cssr_bds(cssr):
         d_rs = np.ones((ns, 3))*np.nan
         d_dts = np.ones((ns, 1))*np.nan
         peph = peph_t(epoch_time)
+        # broadcast orbits/clocks of all satellites of the epoch at once
+        eph_n = B2BData0.find_ephs(nav.eph, epoch_time, (uGNSS.GPS, uGNSS.BDS))
+        rs_n, vs_n, dts_n, drel_n = self.eph_cache.eval(epoch_time, eph_n, True)
         for j, sat in enumerate(B2BData0.sat_n):
             sys, prn = sat2prn(sat)
             sat_id= sat2id(sat)
@@ -633,20 +649,20 @@ class cssr_bds(cssr):
                 if sat not in B2BData0.sat_n:
                     continue
             # 判断这颗卫星是否有轨道改正
-            if sat not in B2BData0.lc[0].iode.keys():
+            if not B2BData0.stat[sat-1] & SNAP_IODE:
                 continue
-            if sat not in B2BData0.lc[0].dorb:
+            if not B2BData0.stat[sat-1] & SNAP_ORBIT:
                 print("Error")
 
-            iode = B2BData0.lc[0].iode[sat]
-            dorb = B2BData0.lc[0].dorb[sat]  # radial,along-track,cross-track
-            if B2BData0.lc[0].iodc[sat] == B2BData0.lc[0].iodc_c[sat]:
-                dclk = B2BData0.lc[0].dclk[sat]
+            iode = B2BData0.iode[sat-1]
+            dorb = B2BData0.dorb[sat-1]  # radial,along-track,cross-track
+            if B2BData0.iodc[sat-1] == B2BData0.iodc_c[sat-1]:
+                dclk = B2BData0.dclk[sat-1]
             else:
-                dclk = B2BData0.lc[0].dclk[sat]
+                dclk = B2BData0.dclk[sat-1]
                 if ~np.isnan(dclk):
                     str_error=("ERROR: Different orbit-clock IOD : "+time2str(epoch_time) +" "+sat_id+" "+\
-                               str(B2BData0.lc[0].iodc[sat]) + " " + str(B2BData0.lc[0].iodc_c[sat]))
+                               str(B2BData0.iodc[sat-1]) + " " + str(B2BData0.iodc_c[sat-1]))
                     self.log_msg(str_error)
                 continue
             if np.isnan(dclk) or np.isnan(dorb@dorb):
@@ -657,7 +673,7 @@ class cssr_bds(cssr):
             else:
                 continue
 
-            eph = findeph(nav.eph, epoch_time, sat, iode=iode, mode=mode)
+            eph = eph_n[j]
             if eph is None:
                 """
                 print("ERROR: cannot find BRDC for {} mode {} iode {} at {}"
@@ -665,8 +681,8 @@ class cssr_bds(cssr):
                 """
                 continue
 
-            rs[j, :], vs[j, :], dts[j] = eph2pos(epoch_time, eph, True)
-            drel=eph2rel(epoch_time,eph)
+            rs[j, :], vs[j, :], dts[j] = rs_n[j], vs_n[j], dts_n[j]
+            drel = drel_n[j]
             # Along-track, cross-track and radial conversion
             #
             er = vnorm(rs[j, :])
@@ -690,10 +706,10 @@ class cssr_bds(cssr):
 
             # 这里的时间其实是最新的钟差
             # dtclk=timediff(epoch_time,B2BData0.lc[0].t0[sat][sCType.CLOCK])
-            dtclk=timediff(epoch_time,B2BData0.lc[0].t0[sat][sCType.CLOCK])
-            dtorb=timediff(epoch_time,B2BData0.lc[0].t0[sat][sCType.ORBIT])
+            dtclk=B2BData0.timediff(epoch_time, sat, sCType.CLOCK)
+            dtorb=B2BData0.timediff(epoch_time, sat, sCType.ORBIT)
             str_iod="nav_iod={:4d} mask_iod={:4d} clock_iod={:4d} orbit_iod={:4d}"\
-                .format(B2BData0.lc[0].iode[sat],B2BData0.iodssr,B2BData0.lc[0].iodc_c[sat],B2BData0.lc[0].iodc[sat])
+                .format(B2BData0.iode[sat-1],B2BData0.iodssr,B2BData0.iodc_c[sat-1],B2BData0.iodc[sat-1])
             if dtclk>max_clock_delay or dtorb>max_orbit_delay:
                 self.log_msg("ERROR: large orbit/clock difference")
                 self.log_msg("ERROR Data: "+str_iod)
@@ -715,7 +731,7 @@ class cssr_bds(cssr):
             clock_data[sat_id] = str_clock
             orbit_data[sat_id] = str_orbit
 
-        nav_out.peph.append(peph)
+        sp_out.write_epoch(peph)
         nav_out.ne+=1
 
         if encodeRTCM==1:
@@ -723,13 +739,7 @@ class cssr_bds(cssr):
             nsat_orbit = len(orbit_data)
             e = time2epoch(epoch_time)
             str_time = "{:04d} {:02d} {:02d} {:02d} {:02d} {:02d}".format(e[0], e[1], e[2], e[3], e[4], int(e[5]))
-            with open(file_ssr, 'a') as fp:
-                fp.write('> CLOCK {} {}  {:4d} {} \n'.format(str_time, 0, nsat_clock, "B2B"))
-                for sat_id, data in clock_data.items():
-                    fp.write(data)
-                fp.write('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, nsat_orbit, "B2B"))
-                for sat_id, data in orbit_data.items():
-                    fp.write(data)
+            self.ssr_out.write_epoch(file_ssr, str_time, "B2B", clock_data, orbit_data)
             if nsat_orbit != nsat_clock or nsat_clock<15:
                 str_error=">>>>error_time={} nsat_orbit={:4d} nsat_clock={:4d}".format(time2str(epoch_time),nsat_orbit,nsat_clock)
                 self.log_msg(str_error)
@@ -8,9 +8,11 @@ Precise Point Positioning Service Signal PPP-B2b (Version 1.0), 2020
 import numpy as np
 import bitstruct as bs
 from B2b_HAS_decoder.gnss import *
-from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sGNSS, prn2sat, sCType
-from B2b_HAS_decoder.ephemeris import eph2pos, findeph,eph2rel
+from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sGNSS, prn2sat, sCType, local_corr_array
+from B2b_HAS_decoder.ephemeris import eph_cache
+from B2b_HAS_decoder.ssr_writer import ssr_writer
 from B2b_HAS_decoder.peph import peph_t
+from B2b_HAS_decoder.corr_snapshot import SNAP_IODE, SNAP_ORBIT
 
 
 class cssr_bdsC(cssr):
@@ -23,6 +25,18 @@ class cssr_bdsC(cssr):
         self.iodp_p = -1
         self.cb_blen = 12
         self.cb_scl = 0.017
+        # orbit/clock corrections in arrays indexed by sat-1
+        self.lc = []
+        for inet in range(self.MAXNET+1):
+            self.lc.append(local_corr_array())
+            self.lc[inet].inet = inet
+            self.lc[inet].flg_trop = 0
+            self.lc[inet].flg_stec = 0
+            self.lc[inet].nsat_n = 0
+        # table rows of broadcast ephemerides used by encode_SP3()
+        self.eph_cache = eph_cache()
+        # buffered writer of the .ssr files of encode_SP3()
+        self.ssr_out = ssr_writer()
 
     def ssig2rsig(self, sys: sGNSS, utyp: uTYP, ssig):
         gps_tbl = {
@@ -115,22 +129,21 @@ class cssr_bdsC(cssr):
         head = {'uint': 0, 'mi': 0, 'iodssr': iodssr}
         return head
 
-    def add_gnss(self, mask_array, blen, gnss):
-        for mask_str in mask_array:
-            # 将二进制字符串转换为整数
-            mask_int = int(mask_str, 2)  # 将二进制字符串转换为整数
-            # 解码掩码
-            prn, nsat = self.decode_mask(mask_int, blen)
-            self.nsat_g[gnss] = nsat
-            self.nsat_n += nsat
-            if nsat > 0:
-                self.ngnss += 1
-            sys = self.gnss2sys(gnss)
-            for k in range(0, nsat):
-                sat = prn2sat(sys, prn[k])
-                self.sys_n.append(sys)
-                self.sat_n.append(sat)
-                self.gnss_n.append(gnss)
+    def add_gnss(self, mask_str, blen, gnss):
+        # 将二进制字符串转换为整数
+        mask_int = int(mask_str, 2)  # 将二进制字符串转换为整数
+        # 解码掩码
+        prn, nsat = self.decode_mask(mask_int, blen)
+        self.nsat_g[gnss] = nsat
+        self.nsat_n += nsat
+        if nsat > 0:
+            self.ngnss += 1
+        sys = self.gnss2sys(gnss)
+        for k in range(0, nsat):
+            sat = prn2sat(sys, prn[k])
+            self.sys_n.append(sys)
+            self.sat_n.append(sat)
+            self.gnss_n.append(gnss)
 
     def decode_cssr_mask(self, v,):
         """decode MT1 Mask message """
@@ -166,19 +179,11 @@ class cssr_bdsC(cssr):
 
             # 这里是针对每颗卫星进行存储器轨道、钟差的改正数变量进行初始化
             inet = 0
-            self.lc[inet].dclk = {}
-            self.lc[inet].dorb = {}
-            self.lc[inet].iode = {}
-            self.lc[inet].iodc = {}
-            self.lc[inet].iodc_c = {}
-            self.lc[inet].cbias = {}
+            self.lc[inet].init_corr()
             self.nsig_n = np.ones(self.nsat_n, dtype=int)*self.nsig_max
             self.sig_n = {}
             self.ura = {}
 
-            # fallback for inconsistent clock update
-            self.lc[inet].dclk_p = {}
-            self.lc[inet].iodc_c_p = {}
             msg="Change of IODP in decode_cssr_mask"
             self.log_msg(msg)
 
@@ -187,7 +192,7 @@ class cssr_bdsC(cssr):
         self.iodssr = head['iodssr']
 
         self.lc[0].cstat |= (1 << sCType.MASK)
-        self.lc[0].t0[sCType.MASK] = self.time
+        self.lc[0].t0_mask = self.time
         # self.lc[0].t0[0][sCType.MASK] = self.time
         self.log_msg("decode_ssr_mask: iodp= "+str(self.iodp))
 
@@ -201,12 +206,12 @@ class cssr_bdsC(cssr):
 
         i = 0
         while i < 6:
-            slot, iodn, iodc = v['satslot'][0][i], v['iodn'][0][i], v['iodcorr'][0][i]
+            slot, iodn, iodc = v['satslot'][i], v['iodn'][i], v['iodcorr'][i]
 
-            dx, dy, dz = v['Rorb'][0][i], v['Aorb'][0][i], v['Corb'][0][i]
-            ucls = int(v['URAI'][0][i][0])
+            dx, dy, dz = v['Rorb'][i], v['Aorb'][i], v['Corb'][i]
+            ucls = int(v['URAI'][i][0])
             try:
-                uval = 3 if v['URAI'][0][i][1] == 'f' else int(v['URAI'][0][i][1])
+                uval = 3 if v['URAI'][i][1] == 'f' else int(v['URAI'][i][1])
             except ValueError:
                 # Handle the case where the conversion to int fails
                 # For example, you can set uval to a default value or log an error
@@ -284,20 +289,6 @@ class cssr_bdsC(cssr):
 
         return i
 
-    def decode_cssr_clk_sat(self, v,i, inet, sat):
-        """ decode clock correction for satellite """
-        iodc, dclk = v['iodcorr'][0][i], v['sc0'][0][i]
-
-        if sat in self.lc[inet].iodc_c.keys() and \
-                iodc != self.lc[inet].iodc_c[sat]:
-            self.lc[inet].iodc_c_p[sat] = self.lc[inet].iodc_c[sat]
-            self.lc[inet].dclk_p[sat] = self.lc[inet].dclk[sat]
-        self.lc[inet].iodc_c[sat] = iodc
-        # note: the sign of the clock correction reversed
-        self.lc[inet].dclk[sat] = - self.sval(dclk)
-        if ~np.isnan(self.lc[inet].dclk[sat]):
-            str_cssr_clk_sat = 'cssr_clk_sat: %s %s %d %.3f ' % (sat2id(sat), time2str(self.time), iodc, self.lc[inet].dclk[sat])
-            self.log_msg(str_cssr_clk_sat)
     def decode_cssr_clk(self, v, inet=0):
         """decode MT4 Clock Correction message """
         head = self.decode_head(v)
@@ -305,9 +296,7 @@ class cssr_bdsC(cssr):
             return -1
 
         iodp = v['iodp']
-        st1 = v['sub']
-
-        st1_value = st1[0]  # 提取st1数组中的唯一值
+        st1_value = int(v['sub'])
 
         if iodp != self.iodp:
             return -1
@@ -316,18 +305,19 @@ class cssr_bdsC(cssr):
         # 卫星钟差改正：     self.lc[inet].dclk[sat] =
         # 这颗卫星的时间，   self.lc[inet].t0[sat][sCType.CLOCK] = self.time 这里分别保存了每一种参数的时间
         # 钟差的iod_ssr:   self.iodssr_c[sCType.CLOCK] = head['iodssr']
-        for i in range(23):
-            idx = st1_value * 23 + i
-            # 使用 idx 访问 self.sat_n 或进行其他操作
-            if idx < self.nsat_n:
-                sat = self.sat_n[idx]
-                self.decode_cssr_clk_sat(v,i, inet, sat)
-                if sat not in self.lc[inet].t0:
-                    self.lc[inet].t0[sat] = {}
-                try:
-                    self.lc[inet].t0[sat][sCType.CLOCK] = self.time
-                except TypeError as e:
-                    print(f"An error occurred: {e}")
+        idx = st1_value * 23 + np.arange(23)
+        k = np.flatnonzero(idx < self.nsat_n)
+        sats = np.array(self.sat_n)[idx[k]]
+        iodc = v['iodcorr'][k]
+        # note: the sign of the clock correction reversed
+        dclk = -np.array([self.sval(u) for u in v['sc0'][k]])
+        if len(sats) > 0:
+            self.lc[inet].set_clk(sats, iodc, dclk, self.time)
+        if self.monlevel > 0 and self.fh is not None:
+            str_time = time2str(self.time)
+            for sat, iodc_, dclk_ in zip(sats.tolist(), iodc, dclk):
+                if ~np.isnan(dclk_):
+                    self.log_msg('cssr_clk_sat: %s %s %d %.3f ' % (sat2id(sat), str_time, iodc_, dclk_))
 
         self.iodssr_c[sCType.CLOCK] = head['iodssr']
         self.lc[inet].cstat |= (1 << sCType.CLOCK)
@@ -353,52 +343,10 @@ class cssr_bdsC(cssr):
         # self.lc[0].t0[0][sCType.URA] = self.time
         return i
 
-    def decode_cssr_comb1(self, msg, i, inet=0):
-        """decode MT6 combined message #1 """
-        numc, numo = bs.unpack_from('u5u3', msg, i)
-        sat_n = np.array(self.sat_n)
-
-        if numc > 0:
-            tod, _, iodssr, iodp, slot_s = \
-                bs.unpack_from('u17u4u2u4u9', msg, i)
-            i += 36
-            for k in range(numc):
-                idx = slot_s + k
-                sat = self.sat_n[idx]
-                i = self.decode_cssr_clk_sat(msg, i, inet, sat)
-
-        if numo > 0:
-            tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
-            i += 23
-            for k in range(numo):
-                i = self.decode_cssr_orb_sat(msg, i, inet, sat_n)
-
-        return i
-
-    def decode_cssr_comb2(self, msg, i, inet=0):
-        """decode MT7 combined message #2 """
-        numc, numo = bs.unpack_from('u5u3', msg, i)
-        sat_n = np.array(self.sat_n)
-
-        if numc > 0:
-            tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
-            i += 23
-            for k in range(numc):
-                slot = bs.unpack_from('u9', msg, i)
-                i += 9
-                sys, prn = self.slot2prn(slot)
-                sat = prn2sat(sys, prn)
-                i = self.decode_cssr_clk_sat(msg, i, inet, sat)
-
-        if numo > 0:
-            tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
-            i += 23
-            for k in range(numo):
-                i = self.decode_cssr_orb_sat(msg, i, inet, sat_n)
-
-        return i
-
     def decode_cssr(self, v):
+        """ decode PPP-B2b message record (np.void or one-row array) """
+        if isinstance(v, np.ndarray):
+            v = v[0]
         if 'BDS' in v.dtype.names:
             self.subtype = sCSSR.MASK
             self.decode_cssr_mask(v)
@@ -437,6 +385,9 @@ class cssr_bdsC(cssr):
         d_rs = np.ones((ns, 3))*np.nan
         d_dts = np.ones((ns, 1))*np.nan
         peph = peph_t(epoch_time)
+        # broadcast orbits/clocks of all satellites of the epoch at once
+        eph_n = B2BData0.find_ephs(nav.eph, epoch_time, (uGNSS.GPS, uGNSS.BDS))
+        rs_n, vs_n, dts_n, drel_n = self.eph_cache.eval(epoch_time, eph_n, True)
         for j, sat in enumerate(B2BData0.sat_n):
             sys, prn = sat2prn(sat)
             sat_id= sat2id(sat)
@@ -449,20 +400,20 @@ class cssr_bdsC(cssr):
                 if sat not in B2BData0.sat_n:
                     continue
             # 判断这颗卫星是否有轨道改正
-            if sat not in B2BData0.lc[0].iode.keys():
+            if not B2BData0.stat[sat-1] & SNAP_IODE:
                 continue
-            if sat not in B2BData0.lc[0].dorb:
+            if not B2BData0.stat[sat-1] & SNAP_ORBIT:
                 print("Error")
 
-            iode = B2BData0.lc[0].iode[sat]
-            dorb = B2BData0.lc[0].dorb[sat]  # radial,along-track,cross-track
-            if B2BData0.lc[0].iodc[sat] == B2BData0.lc[0].iodc_c[sat]:
-                dclk = B2BData0.lc[0].dclk[sat]
+            iode = B2BData0.iode[sat-1]
+            dorb = B2BData0.dorb[sat-1]  # radial,along-track,cross-track
+            if B2BData0.iodc[sat-1] == B2BData0.iodc_c[sat-1]:
+                dclk = B2BData0.dclk[sat-1]
             else:
-                dclk = B2BData0.lc[0].dclk[sat]
+                dclk = B2BData0.dclk[sat-1]
                 if ~np.isnan(dclk):
                     str_error=("ERROR: Different orbit-clock IOD : "+time2str(epoch_time) +" "+sat_id+" "+\
-                               str(B2BData0.lc[0].iodc[sat]) + " " + str(B2BData0.lc[0].iodc_c[sat]))
+                               str(B2BData0.iodc[sat-1]) + " " + str(B2BData0.iodc_c[sat-1]))
                     self.log_msg(str_error)
                 continue
             if np.isnan(dclk) or np.isnan(dorb@dorb):
@@ -473,7 +424,7 @@ class cssr_bdsC(cssr):
             else:
                 continue
 
-            eph = findeph(nav.eph, epoch_time, sat, iode=iode, mode=mode)
+            eph = eph_n[j]
             if eph is None:
                 """
                 print("ERROR: cannot find BRDC for {} mode {} iode {} at {}"
@@ -481,8 +432,8 @@ class cssr_bdsC(cssr):
                 """
                 continue
 
-            rs[j, :], vs[j, :], dts[j] = eph2pos(epoch_time, eph, True)
-            drel=eph2rel(epoch_time,eph)
+            rs[j, :], vs[j, :], dts[j] = rs_n[j], vs_n[j], dts_n[j]
+            drel = drel_n[j]
             # Along-track, cross-track and radial conversion
             #
             er = vnorm(rs[j, :])
@@ -506,13 +457,13 @@ class cssr_bdsC(cssr):
 
             # 这里的时间其实是最新的钟差
             # dtclk=timediff(epoch_time,B2BData0.lc[0].t0[sat][sCType.CLOCK])
-            dtclk=timediff(epoch_time,B2BData0.lc[0].t0[sat][sCType.CLOCK])
-            dtorb=timediff(epoch_time,B2BData0.lc[0].t0[sat][sCType.ORBIT])
+            dtclk=B2BData0.timediff(epoch_time, sat, sCType.CLOCK)
+            dtorb=B2BData0.timediff(epoch_time, sat, sCType.ORBIT)
             str_diff="obst= {} obst_orbt={} obst_clkt={} sat={} diff rac[m] {:8.3f} {:8.3f} {:8.3f} clk[m] {:12.6f}  dclk[m] {:12.6f} "\
                 .format(time2str(epoch_time),dtorb,dtclk,sat2id(sat),dorb[0], dorb[1], dorb[2],\
                         d_dts[j, 0]*rCST.CLIGHT,dclk)
             str_iod="nav_iod={:4d} mask_iod={:4d} clock_iod={:4d} orbit_iod={:4d}"\
-                .format(B2BData0.lc[0].iode[sat],B2BData0.iodssr,B2BData0.lc[0].iodc_c[sat],B2BData0.lc[0].iodc[sat])
+                .format(B2BData0.iode[sat-1],B2BData0.iodssr,B2BData0.iodc_c[sat-1],B2BData0.iodc[sat-1])
             if dtclk>max_clock_delay or dtorb>max_orbit_delay:
                 self.log_msg("ERROR: large orbit/clock difference")
                 self.log_msg("ERROR Data: "+str_diff+str_iod)
@@ -534,7 +485,7 @@ class cssr_bdsC(cssr):
             clock_data[sat_id] = str_clock
             orbit_data[sat_id] = str_orbit
 
-        nav_out.peph.append(peph)
+        sp_out.write_epoch(peph)
         nav_out.ne+=1
 
         if encodeRTCM==1:
@@ -542,13 +493,7 @@ class cssr_bdsC(cssr):
             nsat_orbit = len(orbit_data)
             e = time2epoch(epoch_time)
             str_time = "{:04d} {:02d} {:02d} {:02d} {:02d} {:02d}".format(e[0], e[1], e[2], e[3], e[4], int(e[5]))
-            with open(file_ssr, 'a') as fp:
-                fp.write('> CLOCK {} {}  {:4d} {} \n'.format(str_time, 0, nsat_clock, "B2B"))
-                for sat_id, data in clock_data.items():
-                    fp.write(data)
-                fp.write('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, nsat_orbit, "B2B"))
-                for sat_id, data in orbit_data.items():
-                    fp.write(data)
+            self.ssr_out.write_epoch(file_ssr, str_time, "B2B", clock_data, orbit_data)
             if nsat_orbit != nsat_clock or nsat_clock<15:
                 str_error=">>>>error_time={} nsat_orbit={:4d} nsat_clock={:4d}".format(time2str(epoch_time),nsat_orbit,nsat_clock)
                 self.log_msg(str_error)
@@ -6,13 +6,15 @@ Galileo HAS correction data decoder
 
 """
 
+from collections import OrderedDict
 import numpy as np
 import bitstruct as bs
-import galois
 from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE
 from B2b_HAS_decoder.peph import peph,peph_t
+from B2b_HAS_decoder.gf256 import gf_inv, gf_matmul
 from B2b_HAS_decoder.gnss import *
-from B2b_HAS_decoder.ephemeris import eph2pos, findeph,eph2rel
+from B2b_HAS_decoder.ephemeris import eph_cache
+from B2b_HAS_decoder.ssr_writer import ssr_writer
 from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sCType
 
 class cssr_has(cssr):
@@ -29,7 +31,16 @@ class cssr_has(cssr):
         self.pb_blen = 11
         self.pb_scl = 0.01  # cycles
 
-        self.GF = galois.GF(256)
+        # LRU cache of inverted generator sub-matrices keyed by page IDs
+        self.rs_cache = OrderedDict()
+        self.rs_cache_size = 128
+        self.rs_cache_hit = 0
+        self.rs_cache_miss = 0
+        self.rs_gmat = None
+        # table rows of broadcast ephemerides used by encode_SP3()
+        self.eph_cache = eph_cache()
+        # buffered writer of the .ssr files of encode_SP3()
+        self.ssr_out = ssr_writer()
 
     """
     计算给定n位整数的有符号值
@@ -171,12 +182,39 @@ class cssr_has(cssr):
         然后将这个页面内容表示为Galois域上的矩阵 Wd，尺寸为k x 53。同时，从生成矩阵中取出与索引列表对应的部分，然后对该部分进行逆矩阵运算，
         得到逆矩阵 Dinv，尺寸为 k x k。接着，将 Dinv 乘以 Wd 得到解码后的消息 Md，尺寸为 k x 53。最后，将 Md 转换为字节对象并赋值给 HASmsg。'''
         if k >= ms:
-            Wd = self.GF(has_pages[idx, :])  # kx53
-            Dinv = np.linalg.inv(self.GF(gMat[idx, :k]))  # kxk
-            Md = Dinv @ Wd  # decoded message (kx53)
-            HASmsg = np.array(Md).tobytes()
+            idx = sorted(idx)  # page IDs in order of the cached matrices
+            Wd = np.asarray(has_pages[idx, :], dtype='uint8')  # kx53
+            Dinv = self.rs_decode_matrix(idx, gMat)  # kxk
+            Md = gf_matmul(Dinv, Wd)  # decoded message (kx53)
+            HASmsg = Md.tobytes()
 
         return HASmsg
+
+    def rs_decode_matrix(self, idx, gMat):
+        """
+        inverse of generator sub-matrix for page IDs (LRU cached)
+
+        The rows are in ascending order of the page IDs, so the pages have
+        to be in the same order.
+        """
+        if gMat is not self.rs_gmat:
+            self.rs_cache.clear()
+            self.rs_gmat = gMat
+        idx = sorted(idx)
+        key = tuple(idx)
+        Dinv = self.rs_cache.get(key)
+        if Dinv is not None:
+            self.rs_cache.move_to_end(key)
+            self.rs_cache_hit += 1
+            return Dinv
+        self.rs_cache_miss += 1
+        k = len(idx)
+        Dinv = gf_inv(gMat[idx, :k])
+        self.rs_cache[key] = Dinv
+        if len(self.rs_cache) > self.rs_cache_size:
+            self.rs_cache.popitem(last=False)
+        return Dinv
+
     def log_msg(self,msg):
         if self.monlevel > 0 and self.fh is not None:
             self.fh.write(msg+"\n")
@@ -195,6 +233,9 @@ class cssr_has(cssr):
         d_rs = np.ones((ns, 3))*np.nan
         d_dts = np.ones((ns, 1))*np.nan
         peph = peph_t(epoch_time)
+        # broadcast orbits/clocks of all satellites of the epoch at once
+        eph_n = HASData0.find_ephs(nav.eph, epoch_time, (uGNSS.GPS, uGNSS.GAL))
+        rs_n, vs_n, dts_n, drel_n = self.eph_cache.eval(epoch_time, eph_n, True)
         for j, sat in enumerate(HASData0.sat_n):
             sys, prn = sat2prn(sat)
             sat_id= sat2id(sat)
@@ -207,8 +248,8 @@ class cssr_has(cssr):
             else:
                 continue
 
-            iode = HASData0.lc[0].iode[sat]
-            dorb = HASData0.lc[0].dorb[sat]  # radial,along-track,cross-track
+            iode = HASData0.iode[sat-1]
+            dorb = HASData0.dorb[sat-1]  # radial,along-track,cross-track
 
             if HASData0.cssrmode == sCSSRTYPE.GAL_HAS_SIS:  # HAS only
                 if HASData0.mask_id != HASData0.mask_id_clk:  # mask has changed
@@ -217,7 +258,7 @@ class cssr_has(cssr):
             else:
                 print("=======>Error: unrecongnized format for PPP")
 
-            dclk = HASData0.lc[0].dclk[sat]
+            dclk = HASData0.dclk[sat-1]
 
             if np.isnan(dclk) or np.isnan(dorb@dorb):
                 continue
@@ -227,7 +268,7 @@ class cssr_has(cssr):
             else:
                 continue
 
-            eph = findeph(nav.eph, epoch_time, sat, iode=iode, mode=mode)
+            eph = eph_n[j]
             if eph is None:
                 """
                 print("ERROR: cannot find BRDC for {} mode {} iode {} at {}"
@@ -237,8 +278,8 @@ class cssr_has(cssr):
             if HASData0.mask_id != HASData0.mask_id_clk:  # mask has changed
                 self.log_msg("ERROR: not matching id for orbit and clock, oribt_id= "+str(HASData0.mask_id)+" clock_id= "+str(HASData0.mask_id_clk)+"  "+time2str(epoch_time))
                 continue
-            rs[j, :], vs[j, :], dts[j] = eph2pos(epoch_time, eph, True)
-            drel=eph2rel(epoch_time,eph)
+            rs[j, :], vs[j, :], dts[j] = rs_n[j], vs_n[j], dts_n[j]
+            drel = drel_n[j]
             # Along-track, cross-track and radial conversion
             #
             er = vnorm(rs[j, :])
@@ -265,9 +306,9 @@ class cssr_has(cssr):
                 sp_out.sat.append(sat)
 
 
-            dtclk=timediff(epoch_time,HASData0.lc[0].t0[sat][sCType.CLOCK])
-            dtorb=timediff(epoch_time,HASData0.lc[0].t0[sat][sCType.ORBIT])
-            str_iod="nav_iod={:4d} mask_iod={:4d} ".format(HASData0.lc[0].iode[sat],HASData0.iodssr)
+            dtclk=HASData0.timediff(epoch_time, sat, sCType.CLOCK)
+            dtorb=HASData0.timediff(epoch_time, sat, sCType.ORBIT)
+            str_iod="nav_iod={:4d} mask_iod={:4d} ".format(HASData0.iode[sat-1],HASData0.iodssr)
             if dtclk>max_clock_delay or dtorb>max_orbit_delay:
                 self.log_msg("ERROR: large orbit/clock difference")
                 self.log_msg("ERROR Data: "+str_iod)
@@ -288,16 +329,10 @@ class cssr_has(cssr):
             self.log_msg(str_error)
             return
 
-        nav_out.peph.append(peph)
+        sp_out.write_epoch(peph)
         nav_out.ne+=1
 
         if encodeRTCM==1:
             e = time2epoch(epoch_time)
             str_time = "{:04d} {:02d} {:02d} {:02d} {:02d} {:02d}".format(e[0], e[1], e[2], e[3], e[4], int(e[5]))
-            with open(file_ssr, 'a') as fp:
-                fp.write('> CLOCK {} {}  {:4d} {} \n'.format(str_time, 0, nsat_clock, "HAS"))
-                for sat_id, data in clock_data.items():
-                    fp.write(data)
-                fp.write('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, nsat_orbit, "HAS"))
-                for sat_id, data in orbit_data.items():
-                    fp.write(data)
+            self.ssr_out.write_epoch(file_ssr, str_time, "HAS", clock_data, orbit_data)
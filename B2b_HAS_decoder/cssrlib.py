@@ -227,6 +227,210 @@ class local_corr:
         self.cstat = 0            # status for receiving CSSR message
 
 
+class sat_array:
+    """
+    per-satellite values in array indexed by sat-1 with validity mask
+
+    The access is compatible to dict {sat: value} for existing callers.
+    Vector values are returned as copies as values in a dict are replaced,
+    not modified, by the decoders.
+    """
+    __slots__ = ('val', 'mask', 'fill')
+
+    def __init__(self, shape=(), dtype=float, fill=np.nan):
+        self.val = np.full((uGNSS.MAXSAT,)+shape, fill, dtype=dtype)
+        self.mask = np.zeros(uGNSS.MAXSAT, dtype=bool)
+        self.fill = fill
+
+    def __contains__(self, sat):
+        return 0 < sat <= uGNSS.MAXSAT and self.mask[sat-1]
+
+    def __getitem__(self, sat):
+        if sat not in self:
+            raise KeyError(sat)
+        v = self.val[sat-1]
+        return v.copy() if v.ndim > 0 else v.item()
+
+    def __setitem__(self, sat, v):
+        if not 0 < sat <= uGNSS.MAXSAT:
+            raise KeyError(sat)
+        self.val[sat-1] = v
+        self.mask[sat-1] = True
+
+    def __delitem__(self, sat):
+        if sat not in self:
+            raise KeyError(sat)
+        self.val[sat-1] = self.fill
+        self.mask[sat-1] = False
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, sat, default=None):
+        return self[sat] if sat in self else default
+
+    def keys(self):
+        return (np.flatnonzero(self.mask)+1).tolist()
+
+    def values(self):
+        return [self[sat] for sat in self.keys()]
+
+    def items(self):
+        return [(sat, self[sat]) for sat in self.keys()]
+
+    def clear(self):
+        self.val[:] = self.fill
+        self.mask[:] = False
+
+
+class sat_t0_sat:
+    """ reference times t0[sat][ctype] of a satellite in sat_t0 """
+    __slots__ = ('t0', 'i')
+
+    def __init__(self, t0, i):
+        self.t0 = t0
+        self.i = i
+
+    def __contains__(self, ctype):
+        return not np.isnan(self.t0.val[self.i, ctype])
+
+    def __getitem__(self, ctype):
+        t = self.t0.val[self.i, ctype]
+        if np.isnan(t):
+            raise KeyError(ctype)
+        return sec2gtime(t)
+
+    def __setitem__(self, ctype, t):
+        self.t0.val[self.i, ctype] = t.time+t.sec
+
+    def keys(self):
+        return [sCType(k) for k in np.flatnonzero(~np.isnan(self.t0.val[self.i]))]
+
+
+class sat_t0:
+    """
+    reference times t0[sat][ctype] in array of float epoch times [s]
+
+    The access is compatible to the nested dict {sat: {ctype: gtime_t}}.
+    """
+    __slots__ = ('val', 'mask')
+
+    def __init__(self):
+        self.val = np.full((uGNSS.MAXSAT, sCType.MAX), np.nan)
+        self.mask = np.zeros(uGNSS.MAXSAT, dtype=bool)
+
+    def __contains__(self, sat):
+        return 0 < sat <= uGNSS.MAXSAT and bool(self.mask[sat-1])
+
+    def __getitem__(self, sat):
+        if not 0 < sat <= uGNSS.MAXSAT or not self.mask[sat-1]:
+            raise KeyError(sat)
+        return sat_t0_sat(self, sat-1)
+
+    def __setitem__(self, sat, v):
+        if not 0 < sat <= uGNSS.MAXSAT:
+            raise KeyError(sat)
+        self.val[sat-1] = np.nan
+        self.mask[sat-1] = True
+        for ctype, t in v.items():
+            self.val[sat-1, ctype] = t.time+t.sec
+
+    def set(self, sats, ctype, t):
+        """ set reference time t of correction type ctype of satellites """
+        k = np.asarray(sats)-1
+        k = k[(k >= 0) & (k < uGNSS.MAXSAT)]  # drop invalid satellites
+        self.val[k[~self.mask[k]]] = np.nan
+        self.val[k, ctype] = t.time+t.sec
+        self.mask[k] = True
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def keys(self):
+        return (np.flatnonzero(self.mask)+1).tolist()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+def sec2gtime(t):
+    """ float epoch time [s] to gtime_t """
+    tt = int(np.floor(t))
+    return gtime_t(tt, t-tt)
+
+
+class local_corr_array:
+    """
+    class for local corrections with array backend
+
+    The per-satellite corrections iode, iodc, iodc_c, dorb, dclk and the
+    reference times t0 are kept in arrays indexed by sat-1 (sat_array,
+    sat_t0), so that the corrections of all satellites are read as arrays,
+    e.g. lc.dorb.val[lc.dorb.mask].
+    """
+    __slots__ = ('inet', 'inet_ref', 'ng', 'pbias', 'cbias', 'iode', 'iodc',
+                 'iodc_c', 'dorb', 'dclk', 'dclk_p', 'iodc_c_p', 'hclk',
+                 'stec', 'trph', 'trpw', 'ci', 'ct', 'quality_trp',
+                 'quality_stec', 'sat_n', 't0', 't0_mask', 'cstat',
+                 'flg_trop', 'flg_stec', 'nsat_n', 'ddft', 'di', 'dstec',
+                 'dtd', 'dtw', 'dvel', 'netmask', 'stec_quality', 'stype',
+                 'svmask', 'trop_quality', 'ttype')
+
+    def __init__(self):
+        self.inet = -1
+        self.inet_ref = -1
+        self.ng = -1
+        self.pbias = None
+        self.hclk = None
+        self.stec = None
+        self.trph = None
+        self.trpw = None
+        self.ci = None
+        self.ct = None
+        self.quality_trp = None
+        self.quality_stec = None
+        self.sat_n = []
+        self.t0 = sat_t0()
+        self.t0_mask = gtime_t()  # reference time of satellite mask
+        self.cstat = 0            # status for receiving CSSR message
+        self.init_corr()
+
+    def init_corr(self):
+        """ clear orbit/clock corrections """
+        self.iode = sat_array(dtype=int, fill=0)
+        self.iodc = sat_array(dtype=int, fill=0)
+        self.iodc_c = sat_array(dtype=int, fill=0)
+        self.dorb = sat_array((3,))
+        self.dclk = sat_array()
+        self.cbias = {}
+        # fallback for inconsistent clock update
+        self.dclk_p = sat_array()
+        self.iodc_c_p = sat_array(dtype=int, fill=0)
+
+    def set_clk(self, sats, iodc, dclk, t):
+        """ set clock corrections of satellites at reference time t """
+        k = np.asarray(sats)-1
+        ok = (k >= 0) & (k < uGNSS.MAXSAT)  # drop invalid satellites
+        if not np.all(ok):
+            k = k[ok]
+            iodc = np.broadcast_to(iodc, ok.shape)[ok]
+            dclk = np.broadcast_to(dclk, ok.shape)[ok]
+        # keep previous clock corrections for change of IODC
+        kc = k[self.iodc_c.mask[k] & (self.iodc_c.val[k] != iodc)]
+        self.iodc_c_p.val[kc] = self.iodc_c.val[kc]
+        self.iodc_c_p.mask[kc] = True
+        self.dclk_p.val[kc] = self.dclk.val[kc]
+        self.dclk_p.mask[kc] = True
+        self.iodc_c.val[k] = iodc
+        self.iodc_c.mask[k] = True
+        self.dclk.val[k] = dclk
+        self.dclk.mask[k] = True
+        self.t0.set(k+1, sCType.CLOCK, t)
+
+
 class cssr:
     """ class to process Compact SSR messages """
     CSSR_MSGTYPE = 4073
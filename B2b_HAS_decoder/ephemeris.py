@@ -17,27 +17,77 @@ MAXDTOE_t = {uGNSS.GPS: 7201.0, uGNSS.GAL: 14400.0, uGNSS.QZS: 7201.0,
              uGNSS.SBS: 360.0}
 
 
-def findeph(nav, t, sat, iode=-1, mode=0):
-    """ find ephemeris for sat """
-    sys, _ = sat2prn(sat)
-    eph = None
-    tmax = MAXDTOE_t[sys]
-    tmin = tmax + 1.0
-    for eph_ in nav:
-        if eph_.sat != sat or (iode >= 0 and iode != eph_.iode):
-            continue
-        if eph_.mode != mode:
-            continue
-        dt = abs(timediff(t, eph_.toe))
-        if dt > tmax or eph_.mode != mode:
-            continue
-        if iode >= 0:
-            return eph_
-        if dt <= tmin:
-            eph = eph_
-            tmin = dt
+class eph_index():
+    """
+    index of ephemerides for findeph()
+
+    The ephemerides are grouped by (sat, mode) and sorted by toe, and by
+    (sat, iode, mode) in the order of the list, so that a lookup does not
+    scan the whole list.  The results are the same as the linear scan.
+    """
+
+    def __init__(self, ephs):
+        self.src = ephs
+        self.n = len(ephs)
+        self.iode = {}
+        idx_t = {}
+        for i, eph in enumerate(ephs):
+            idx_t.setdefault((eph.sat, eph.mode), []).append(i)
+            self.iode.setdefault((eph.sat, int(eph.iode), eph.mode), []).append(eph)
+        self.toe = {}
+        for key, idx in idx_t.items():
+            toe = np.array([ephs[i].toe.time+ephs[i].toe.sec for i in idx])
+            k = np.argsort(toe, kind='stable')
+            self.toe[key] = (toe[k], [(idx[j], ephs[idx[j]]) for j in k])
+
+    def find(self, t, sat, iode=-1, mode=0):
+        """ find ephemeris for sat """
+        sys, _ = sat2prn(sat)
+        tmax = MAXDTOE_t[sys]
+        if iode >= 0:  # first ephemeris with matching IODE
+            for eph_ in self.iode.get((sat, int(iode), mode), []):
+                if abs(timediff(t, eph_.toe)) <= tmax:
+                    return eph_
+            return None
+
+        if (sat, mode) not in self.toe:
+            return None
+        toe, ephs = self.toe[(sat, mode)]
+        n = len(toe)
+        k = np.searchsorted(toe, t.time+t.sec)
+        # nearest toe on both sides including duplicates, one more as margin
+        lo = max(np.searchsorted(toe, toe[max(k-1, 0)], 'left')-1, 0)
+        hi = min(np.searchsorted(toe, toe[min(k, n-1)], 'right')+1, n)
+        eph = None
+        tmin = tmax + 1.0
+        # the last one in the list order wins for equal dt as the scan
+        for _, eph_ in sorted(ephs[lo:hi], key=lambda x: x[0]):
+            dt = abs(timediff(t, eph_.toe))
+            if dt > tmax:
+                continue
+            if dt <= tmin:
+                eph = eph_
+                tmin = dt
+        return eph
 
-    return eph
+
+_eph_index = None
+
+
+def get_eph_index(ephs):
+    """ index of the list of ephemerides, rebuilt when the list has changed """
+    global _eph_index
+    if _eph_index is None or _eph_index.src is not ephs or \
+            _eph_index.n != len(ephs):
+        _eph_index = eph_index(ephs)
+    return _eph_index
+
+
+def findeph(nav, t, sat, iode=-1, mode=0):
+    """ find ephemeris for sat, nav: list of Eph or eph_index """
+    if not isinstance(nav, eph_index):
+        nav = get_eph_index(nav)
+    return nav.find(t, sat, iode, mode)
 
 
 def dtadjust(t1, t2, tw=604800):
@@ -244,6 +294,318 @@ def eph2rel(t: gtime_t, eph: Eph):
 
     return dtrel
 
+# ephemeris table (struct-of-arrays) for batch propagation
+EPH_FLOAT = ('A', 'e', 'i0', 'OMG0', 'omg', 'M0', 'deln', 'OMGd', 'idot',
+             'crc', 'crs', 'cuc', 'cus', 'cic', 'cis', 'toes', 'af0', 'af1',
+             'af2', 'Adot', 'delnd')
+
+dtype_eph = [('sat', 'i4'), ('sys', 'i4'), ('geo', '?'), ('mode', 'i4'),
+             ('toe_t', 'i8'), ('toe_s', 'f8'), ('toc_t', 'i8'), ('toc_s', 'f8')] + \
+    [(k, 'f8') for k in EPH_FLOAT]
+
+
+def eph_table(ephs):
+    """
+    Build ephemeris table for eph2pos_batch()
+
+    Parameters
+    ----------
+    ephs : list of Eph
+        ephemerides, None for a row without ephemeris (sat=0)
+
+    Returns
+    -------
+    np.array() of dtype_eph
+        one row per ephemeris
+    """
+    tbl = np.zeros(len(ephs), dtype=dtype_eph)
+    for i, eph in enumerate(ephs):
+        if eph is None:
+            continue
+        sys, prn = sat2prn(eph.sat)
+        tbl[i] = (eph.sat, sys, sys == uGNSS.BDS and (prn <= 5 or prn >= 59),
+                  eph.mode, eph.toe.time, eph.toe.sec, eph.toc.time,
+                  eph.toc.sec) + tuple(getattr(eph, k) for k in EPH_FLOAT)
+    return tbl
+
+
+def dtadjust_batch(t, t_time, t_sec, tw=604800):
+    """ calculate delta time considering week-rollover for arrays of time """
+    if isinstance(t, gtime_t):
+        dt = t.time-t_time
+        dt = dt+(t.sec-t_sec)
+    else:
+        dt = np.array([t_.time for t_ in t])-t_time
+        dt = dt+(np.array([t_.sec for t_ in t])-t_sec)
+    dt = np.where(dt > tw, dt-tw, dt)
+    dt = np.where(dt < -tw, dt+tw, dt)
+    return dt
+
+
+def eph2pos_batch(t, ephs, flg_v=False):
+    """
+    calculate satellite positions of all rows of ephemeris table at once
+
+    Parameters
+    ----------
+    t : gtime_t or list of gtime_t
+        time, common to all rows or one per row
+    ephs : np.array() of dtype_eph or list of Eph
+        ephemeris table (see eph_table())
+
+    Returns
+    -------
+    rs : np.array() of float (n x 3)
+        satellite position in ECEF [m]
+    vs : np.array() of float (n x 3)
+        satellite velocity in ECEF [m/s] (flg_v=True only)
+    dts : np.array() of float (n)
+        satellite clock offset including relativistic correction [s]
+    dtrel : np.array() of float (n)
+        relativistic correction [s]
+
+    The results are the same as eph2pos() and eph2rel() for each row, nan
+    for the rows without ephemeris.
+    """
+    if not isinstance(ephs, np.ndarray):
+        ephs = eph_table(ephs)
+    n = len(ephs)
+    sys = ephs['sys']
+    e = ephs['e']
+    mu = np.full(n, rCST.MU_GPS)
+    omge = np.full(n, rCST.OMGE)
+    mu[sys == uGNSS.GAL] = rCST.MU_GAL
+    omge[sys == uGNSS.GAL] = rCST.OMGE_GAL
+    mu[sys == uGNSS.BDS] = rCST.MU_BDS
+    omge[sys == uGNSS.BDS] = rCST.OMGE_BDS
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dt = dtadjust_batch(t, ephs['toe_t'], ephs['toe_s'])
+        n0 = np.sqrt(mu/ephs['A']**3)
+        cnav = ephs['mode'] > 0
+        dna = np.where(cnav, ephs['deln']+0.5*dt*ephs['delnd'], ephs['deln'])
+        Ak = np.where(cnav, ephs['A']+dt*ephs['Adot'], ephs['A'])
+        nm = n0+dna
+        M = ephs['M0']+nm*dt
+
+        # Kepler's equation, each row stops as eph2pos() when converged
+        E = M.copy()
+        sE = np.zeros(n)
+        idx = np.arange(n)
+        for _ in range(10):
+            sE[idx] = np.sin(E[idx])
+            Enew = M[idx]+e[idx]*sE[idx]
+            conv = np.abs(E[idx]-Enew) < 1e-12
+            E[idx] = Enew
+            idx = idx[~conv]
+            if len(idx) == 0:
+                break
+        cE = np.cos(E)
+        dtc = dtadjust_batch(t, ephs['toc_t'], ephs['toc_s'])
+        dtrel = -2.0*np.sqrt(mu*ephs['A'])*e*sE/rCST.CLIGHT**2
+        dts = ephs['af0']+ephs['af1']*dtc+ephs['af2']*dtc**2 + dtrel
+
+        nus = np.sqrt(1.0-e**2)*sE
+        nuc = cE-e
+        nue = 1.0-e*cE
+
+        nu = np.arctan2(nus, nuc)
+        phi = nu+ephs['omg']
+        c2p = np.cos(2.0*phi)
+        s2p = np.sin(2.0*phi)
+        u = phi+(ephs['cuc']*c2p+ephs['cus']*s2p)
+        r = Ak*nue+(ephs['crc']*c2p+ephs['crs']*s2p)
+        cu = np.cos(u)
+        su = np.sin(u)
+        xo = r*cu
+        yo = r*su
+
+        inc = ephs['i0']+ephs['idot']*dt+(ephs['cic']*c2p+ephs['cis']*s2p)
+        si = np.sin(inc)
+        ci = np.cos(inc)
+
+        geo = ephs['geo']
+        Omg = np.where(geo, ephs['OMG0']+ephs['OMGd']*dt-omge*ephs['toes'],
+                       ephs['OMG0']+ephs['OMGd']*dt-omge*(ephs['toes']+dt))
+        sOmg = np.sin(Omg)
+        cOmg = np.cos(Omg)
+        p = np.stack([cOmg, sOmg, np.zeros(n)], axis=1)
+        q = np.stack([-ci*sOmg, ci*cOmg, si], axis=1)
+        rs = xo[:, None]*p+yo[:, None]*q
+
+        if np.any(geo):  # BDS GEO
+            so = np.sin(omge[geo]*dt[geo])
+            co = np.cos(omge[geo]*dt[geo])
+            rg = rs[geo]
+            rs[geo] = np.stack([
+                co*rg[:, 0]+so*rCST.COS_5*rg[:, 1]+so*rCST.SIN_5*rg[:, 2],
+                -so*rg[:, 0]+co*rCST.COS_5*rg[:, 1]+co*rCST.SIN_5*rg[:, 2],
+                -rCST.SIN_5*rg[:, 1]+rCST.COS_5*rg[:, 2]], axis=1)
+
+        valid = ephs['sat'] > 0
+        rs[~valid] = np.nan
+        dts[~valid] = np.nan
+        dtrel[~valid] = np.nan
+
+        if not flg_v:
+            return rs, dts, dtrel
+
+        # satellite velocity
+        Ed = nm/nue
+        nud = np.sqrt(1.0-e**2)/nue*Ed
+        h2d0 = 2.0*nud*-su
+        h2d1 = 2.0*nud*cu
+        ud = nud+(ephs['cuc']*h2d0+ephs['cus']*h2d1)
+        rd = Ak*e*sE*Ed+(ephs['crc']*h2d0+ephs['crs']*h2d1)
+        xod = rd*cu+(r*ud)*-su
+        yod = rd*su+(r*ud)*cu
+        incd = ephs['idot']+(ephs['cic']*h2d0+ephs['cis']*h2d1)
+        omegd = ephs['OMGd']-omge
+
+        pd = np.stack([-sOmg*omegd, cOmg*omegd, np.zeros(n)], axis=1)
+        qd = np.stack([-ci*cOmg*omegd+si*sOmg*incd,
+                       -ci*sOmg*omegd-si*cOmg*incd, ci*incd], axis=1)
+        vs = (xo[:, None]*pd+yo[:, None]*qd)+(xod[:, None]*p+yod[:, None]*q)
+        vs[~valid] = np.nan
+
+    return rs, vs, dts, dtrel
+
+
+def lagrange_weights(s, n):
+    """ weights of n-point Lagrange interpolation at s (node 0,1,...,n-1) """
+    m = np.arange(n)
+    D = s[:, None, None]-m[None, None, :]+np.zeros((1, n, 1))
+    D[:, m, m] = 1.0
+    den = np.array([np.prod(np.delete(j-m, j)) for j in m])
+    return np.prod(D, axis=2)/den
+
+
+class eph_cache():
+    """
+    cache of ephemeris table rows for consecutive epochs
+
+    The table rows of eph2pos_batch() are kept per ephemeris (sat, iode,
+    mode, toe), so that they are built once for all epochs while the
+    ephemeris is in use.  By default (step=0) the satellite positions are
+    calculated by eph2pos_batch() at every epoch.  With step > 0, position,
+    velocity and relativistic correction are precomputed at nodes every
+    step [s] over the fit interval when the ephemeris is added, and
+    interpolated by norder-point Lagrange polynomial.  The entries are
+    evicted when the ephemeris is older than MAXDTOE_t.
+    """
+
+    def __init__(self, step=0.0, norder=10, size=256):
+        self.step = step
+        self.norder = norder
+        self.tbl = np.zeros(size, dtype=dtype_eph)  # sat=0: free entry
+        self.tmax = np.zeros(size)
+        self.keys = [None]*size
+        self.index = {}
+        self.free = list(range(size-1, -1, -1))
+        if step > 0:
+            tspan = max(MAXDTOE_t.values())+step*norder
+            self.jc = int(np.ceil(tspan/step))  # node of toe
+            self.nnode = 2*self.jc+1
+            self.node = np.zeros((size, self.nnode, 7))  # rs, vs, dtrel
+        self.nhit = 0  # table rows reused
+        self.nmiss = 0  # table rows built
+        self.nevict = 0
+
+    @property
+    def hit_rate(self):
+        n = self.nhit+self.nmiss
+        return self.nhit/n if n > 0 else 0.0
+
+    def grow(self):
+        """ double the size of the cache """
+        n = len(self.tbl)
+        self.tbl = np.concatenate([self.tbl, np.zeros(n, dtype=dtype_eph)])
+        self.tmax = np.concatenate([self.tmax, np.zeros(n)])
+        self.keys += [None]*n
+        self.free += list(range(2*n-1, n-1, -1))
+        if self.step > 0:
+            self.node = np.concatenate([self.node, np.zeros_like(self.node)])
+
+    def add(self, eph, key):
+        """ add ephemeris to the cache, returns the entry """
+        if len(self.free) == 0:
+            self.grow()
+        k = self.free.pop()
+        self.tbl[k] = eph_table([eph])[0]
+        self.tmax[k] = MAXDTOE_t[sat2prn(eph.sat)[0]]
+        self.keys[k] = key
+        self.index[key] = k
+        if self.step > 0:
+            ts = [timeadd(eph.toe, (j-self.jc)*self.step)
+                  for j in range(self.nnode)]
+            rs, vs, _, dtrel = eph2pos_batch(
+                ts, np.repeat(self.tbl[k:k+1], self.nnode), True)
+            self.node[k] = np.column_stack([rs, vs, dtrel])
+        return k
+
+    def evict(self, t):
+        """ remove the ephemerides aged out at t """
+        used = self.tbl['sat'] > 0
+        if not np.any(used):
+            return
+        dt = dtadjust_batch(t, self.tbl['toe_t'], self.tbl['toe_s'])
+        for k in np.flatnonzero(used & (np.abs(dt) > self.tmax)):
+            del self.index[self.keys[k]]
+            self.keys[k] = None
+            self.tbl['sat'][k] = 0
+            self.free.append(k)
+            self.nevict += 1
+
+    def eval(self, t: gtime_t, ephs, flg_v=False):
+        """
+        calculate satellite positions of ephemerides at t
+
+        Returns the same as eph2pos_batch(t, ephs, flg_v).  The results are
+        interpolated from the nodes if step > 0.
+        """
+        self.evict(t)
+        n = len(ephs)
+        slot = np.full(n, -1)
+        for i, eph in enumerate(ephs):
+            if eph is None:
+                continue
+            key = (eph.sat, eph.iode, eph.mode, eph.toe.time, eph.toe.sec)
+            k = self.index.get(key)
+            if k is None:
+                k = self.add(eph, key)
+                self.nmiss += 1
+            else:
+                self.nhit += 1
+            slot[i] = k
+        valid = slot >= 0
+
+        if self.step <= 0:
+            tbl = np.zeros(n, dtype=dtype_eph)
+            tbl[valid] = self.tbl[slot[valid]]
+            return eph2pos_batch(t, tbl, flg_v)
+
+        rs = np.full((n, 3), np.nan)
+        vs = np.full((n, 3), np.nan)
+        dts = np.full(n, np.nan)
+        dtrel = np.full(n, np.nan)
+        k = slot[valid]
+        tbl = self.tbl[k]
+        x = dtadjust_batch(t, tbl['toe_t'], tbl['toe_s'])/self.step+self.jc
+        i0 = np.clip(np.floor(x).astype(int)-self.norder//2+1, 0,
+                     self.nnode-self.norder)
+        y = self.node[k[:, None], i0[:, None]+np.arange(self.norder)]
+        v = np.einsum('ij,ijk->ik', lagrange_weights(x-i0, self.norder), y)
+        rs[valid] = v[:, 0:3]
+        vs[valid] = v[:, 3:6]
+        dtrel[valid] = v[:, 6]
+        dtc = dtadjust_batch(t, tbl['toc_t'], tbl['toc_s'])
+        dts[valid] = tbl['af0']+tbl['af1']*dtc+tbl['af2']*dtc**2 + v[:, 6]
+
+        if flg_v:
+            return rs, vs, dts, dtrel
+        return rs, dts, dtrel
+
+
 def eph2clk(time, eph):
     """ calculate clock offset based on ephemeris """
     t = timediff(time, eph.toc)
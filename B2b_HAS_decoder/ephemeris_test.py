@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+#  unit test for eph_cache of ephemeris.py against eph2pos_batch()
+#
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+from B2b_HAS_decoder.gnss import Eph, uGNSS, prn2sat, gpst2time, sat2prn, \
+    timediff
+from B2b_HAS_decoder.ephemeris import eph_cache, eph2pos_batch, MAXDTOE_t
+
+# satellites: system, PRN, navigation mode (1: CNAV with Adot/delnd)
+SATS = [(uGNSS.GPS, 3, 0), (uGNSS.GAL, 11, 0), (uGNSS.BDS, 25, 0),
+        (uGNSS.BDS, 3, 0), (uGNSS.BDS, 60, 1), (uGNSS.GPS, 7, 1)]
+
+# random broadcast ephemerides with toe in 0-1.5 h of day 1 -------------------
+def make_ephs(n, seed=1):
+    rng = np.random.default_rng(seed)
+    ephs = []
+    for k in range(n):
+        sys, prn, mode = SATS[k % len(SATS)]
+        geo = sys == uGNSS.BDS and (prn <= 5 or prn >= 59)
+        e = Eph(prn2sat(sys, prn))
+        e.iode = k
+        e.mode = mode
+        e.A = (42164e3 if geo else 26560e3)+rng.normal()*1e3
+        e.e = rng.uniform(0, 0.02)
+        e.i0 = rng.uniform(0, 1)
+        e.OMG0, e.omg, e.M0 = rng.uniform(-3, 3, 3)
+        e.deln = rng.normal()*1e-9
+        e.OMGd = -8e-9
+        e.idot = 1e-10
+        e.crc, e.crs = 200.0, -30.0
+        e.cuc, e.cus = 1e-6, 5e-6
+        e.cic, e.cis = 1e-7, -1e-7
+        e.toe = gpst2time(2300, 86400+rng.integers(0, 10)*600.0)
+        e.toc = e.toe
+        e.toes = 86400.0
+        e.af0, e.af1, e.af2 = 1e-4, 1e-11, 1e-18
+        e.Adot = 0.01*mode
+        e.delnd = 1e-13*mode
+        ephs.append(e)
+    return ephs
+
+# ephemerides valid at t, None for others -------------------------------------
+def valid_ephs(t, ephs):
+    return [e if abs(timediff(t, e.toe)) <= MAXDTOE_t[sat2prn(e.sat)[0]]
+            else None for e in ephs]+[None]
+
+
+def check_cache(step, tol):
+    ephs = make_ephs(30)
+    cache = eph_cache(step=step, size=8)
+    for k in range(0, 16200, 97):
+        t = gpst2time(2300, 86400+k+0.25)
+        ok = valid_ephs(t, ephs)
+        r = cache.eval(t, ok, True)
+        q = eph2pos_batch(t, ok, True)
+        for i in range(4):
+            assert np.array_equal(np.isnan(r[i]), np.isnan(q[i]))
+            d = np.abs(r[i]-q[i])
+            assert np.all(d[~np.isnan(d)] <= tol[i]), (step, i, np.nanmax(d))
+    assert cache.nhit > 0 and cache.nevict > 0
+
+
+def test_cache_table():
+    check_cache(0.0, (0.0, 0.0, 0.0, 0.0))
+
+
+def test_cache_node():
+    # rs [m], vs [m/s], dts [s], dtrel [s]
+    check_cache(300.0, (1e-3, 1e-6, 1e-15, 1e-15))
+
+
+if __name__ == '__main__':
+    test_cache_table()
+    test_cache_node()
+    print('OK')
@@ -0,0 +1,58 @@
+"""
+module for GF(256) arithmetic used by the HAS Reed-Solomon decoder
+
+[1] Galileo High Accuracy Service Signal-in-Space
+  Interface Control Document (HAS SIS ICD), Issue 1.0, May 2022
+
+  field generated by the primitive polynomial p(x) = x^8+x^4+x^3+x^2+1 [1]
+"""
+
+import numpy as np
+
+GF_POLY = 0x11D  # primitive polynomial
+
+# generate log/antilog tables ---------------------------------------------------
+def init_table(poly=GF_POLY):
+    exp = np.zeros(512, dtype='uint8')
+    log = np.zeros(256, dtype='int32')
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= poly
+    exp[255:510] = exp[:255]
+    a = np.arange(256)
+    mul = exp[log[a][:, None] + log[a][None, :]]
+    mul[0, :] = mul[:, 0] = 0
+    inv = np.zeros(256, dtype='uint8')
+    inv[1:] = exp[255 - log[1:]]
+    return exp, log, mul, inv
+
+GF_EXP, GF_LOG, GF_MUL, GF_INV = init_table()
+
+# matrix product over GF(256) --------------------------------------------------
+def gf_matmul(A, B):
+    """ C = A B over GF(256), A: (n x k), B: (k x m) uint8 """
+    A = np.asarray(A, dtype='uint8')
+    B = np.asarray(B, dtype='uint8')
+    return np.bitwise_xor.reduce(GF_MUL[A[:, :, None], B[None, :, :]], axis=1)
+
+# matrix inverse over GF(256) --------------------------------------------------
+def gf_inv(A):
+    """ inverse of A (k x k) over GF(256) by Gauss-Jordan elimination """
+    k = len(A)
+    M = np.hstack([np.asarray(A, dtype='uint8'), np.eye(k, dtype='uint8')])
+    for c in range(k):
+        p = np.flatnonzero(M[c:, c])
+        if len(p) == 0:
+            raise np.linalg.LinAlgError('singular matrix over GF(256)')
+        p = p[0] + c
+        if p != c:
+            M[[c, p]] = M[[p, c]]
+        M[c] = GF_MUL[GF_INV[M[c, c]], M[c]]
+        f = M[:, c].copy()
+        f[c] = 0
+        M ^= GF_MUL[f[:, None], M[c][None, :]]
+    return M[:, k:]
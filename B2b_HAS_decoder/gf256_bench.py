@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+#
+#  benchmark of HAS decoding by gf256.py against galois
+#
+import sys, os, time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+from B2b_HAS_decoder.gf256_test import has_cases, decode_galois, decode_gf256
+
+# time of decoding HAS messages by galois and gf256 [ms/message] --------------
+def bench(n=300):
+    cases = has_cases(n)
+    t = [0.0, 0.0]
+    for j, decode in enumerate((decode_galois, decode_gf256)):
+        decode(*cases[0][:2])  # warm-up
+        t0 = time.perf_counter()
+        for D, pages, msg in cases:
+            assert np.array_equal(decode(D, pages), msg)
+        t[j] = (time.perf_counter()-t0)/n*1e3
+    return t
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    t = bench(n)
+    print('HAS decoding: galois={:.3f} gf256={:.3f} ms/message ({:.1f}x)'.format(
+        t[0], t[1], t[0]/t[1]))
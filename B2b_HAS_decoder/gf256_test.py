@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+#  unit test of gf256.py against galois
+#
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+import galois
+from B2b_HAS_decoder.gf256 import gf_inv, gf_matmul
+
+GF = galois.GF(256)  # p(x) = x^8+x^4+x^3+x^2+1 as gf256.GF_POLY
+
+file_gMat = os.path.join(os.path.dirname(__file__),
+    'Galileo-HAS-SIS-ICD_1.0_Annex_B_Reed_Solomon_Generator_Matrix.txt')
+
+# random HAS page sets: decoding matrix, received pages and message -----------
+def has_cases(n, seed=1):
+    gMat = np.genfromtxt(file_gMat, dtype='u1', delimiter=',')
+    rng = np.random.default_rng(seed)
+    cases = []
+    while len(cases) < n:
+        k = int(rng.integers(1, 33))
+        msg = rng.integers(0, 256, (k, 53)).astype('u1')
+        idx = np.sort(rng.choice(255, k, replace=False))
+        D = gMat[idx, :k]
+        if np.linalg.matrix_rank(GF(D)) < k:  # pages not decodable
+            continue
+        cases.append((D, np.array(GF(D) @ GF(msg)), msg))
+    return cases
+
+# decode HAS message by galois -------------------------------------------------
+def decode_galois(D, pages):
+    return np.array(np.linalg.inv(GF(D)) @ GF(pages))
+
+# decode HAS message by gf256 --------------------------------------------------
+def decode_gf256(D, pages):
+    return gf_matmul(gf_inv(D), pages)
+
+
+def test_matmul():
+    rng = np.random.default_rng(2)
+    for n, k, m in ((1, 1, 1), (5, 7, 3), (32, 32, 53), (255, 32, 53)):
+        A = rng.integers(0, 256, (n, k)).astype('u1')
+        B = rng.integers(0, 256, (k, m)).astype('u1')
+        assert np.array_equal(gf_matmul(A, B), np.array(GF(A) @ GF(B)))
+
+
+def test_inv():
+    rng = np.random.default_rng(3)
+    I = np.eye(32, dtype='u1')
+    ninv = 0
+    for _ in range(50):
+        A = rng.integers(0, 256, (32, 32)).astype('u1')
+        try:
+            Ainv = np.array(np.linalg.inv(GF(A)))
+        except np.linalg.LinAlgError:
+            try:
+                gf_inv(A)
+            except np.linalg.LinAlgError:
+                continue
+            raise AssertionError('gf_inv() of singular matrix')
+        assert np.array_equal(gf_inv(A), Ainv)
+        assert np.array_equal(gf_matmul(A, gf_inv(A)), I)
+        ninv += 1
+    assert ninv > 0
+    try:
+        gf_inv(np.zeros((3, 3), dtype='u1'))
+    except np.linalg.LinAlgError:
+        pass
+    else:
+        raise AssertionError('gf_inv() of zero matrix')
+
+
+def test_has_decode():
+    for D, pages, msg in has_cases(50):
+        assert np.array_equal(decode_gf256(D, pages), msg)
+        assert np.array_equal(decode_galois(D, pages), msg)
+
+
+if __name__ == '__main__':
+    test_matmul()
+    test_inv()
+    test_has_decode()
+    print('OK')
@@ -5,6 +5,8 @@ Created on Sun Aug 22 21:01:49 2021
 @author: ruihi
 """
 
+import os
+import shutil
 from B2b_HAS_decoder.gnss import *
 import numpy as np
 from math import pow, sin, cos
@@ -16,16 +18,176 @@ EXTERR_CLK = 1e-3
 EXTERR_EPH = 5e-7
 
 
+class peph_sats:
+    """
+    satellites of the rows of peph_t, shared by the epochs of a SP3 file
+
+    idx[sat-1] is the row of sat, -1 if sat has no row.
+    """
+
+    def __init__(self, sats=()):
+        self.sat = []
+        self.idx = np.full(uGNSS.MAXSAT, -1, dtype='int16')
+        for sat in sats:
+            self.add(sat)
+
+    def __len__(self):
+        return len(self.sat)
+
+    def add(self, sat):
+        """ add row of sat, returns the row """
+        k = self.idx[sat-1]
+        if k < 0:
+            k = len(self.sat)
+            self.sat.append(sat)
+            self.idx[sat-1] = k
+        return k
+
+
+# index of values in peph_t and value of satellites without data
+PEPH_POS, PEPH_VEL, PEPH_STD, PEPH_VST = 0, 1, 2, 3
+PEPH_FILL = (np.nan, np.nan, 0.0, 0.0)
+
+
+class peph_val:
+    """
+    accessor of pos, vel, std or vst of peph_t with the indexing of a
+    (uGNSS.MAXSAT, 4) array, e.g. peph.pos[sat-1, 0:3]
+    """
+    __slots__ = ('ep', 'i')
+    shape = (uGNSS.MAXSAT, 4)
+
+    def __init__(self, ep, i):
+        self.ep = ep
+        self.i = i
+
+    def __getitem__(self, key):
+        i, j = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if isinstance(i, (int, np.integer)):
+            v = self.ep.get_row(self.i, i+1 if i >= 0 else uGNSS.MAXSAT+i+1)
+            return v[j] if len(j) > 0 else v
+        return self.ep.toarray(self.i)[key]
+
+    def __setitem__(self, key, val):
+        i, j = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if isinstance(i, (int, np.integer)):
+            k = self.ep.rows.add(i+1 if i >= 0 else uGNSS.MAXSAT+i+1)
+        else:
+            sats = np.arange(1, uGNSS.MAXSAT+1)[i]
+            k = [self.ep.rows.add(int(sat)) for sat in sats]
+        self.ep.block(self.i)[(k,)+j] = val
+
+    def __array__(self, dtype=None, copy=None):
+        a = self.ep.toarray(self.i)
+        return a if dtype is None else a.astype(dtype)
+
+    def __len__(self):
+        return uGNSS.MAXSAT
+
+
 class peph_t:
-    def __init__(self, time=None):
+    """
+    satellite positions/clocks of one epoch
+
+    The values are kept only for the satellites with data, as blocks of
+    (number of rows, 4) allocated on the first write.  The rows (peph_sats)
+    can be shared by all epochs of a file.  pos, vel, std and vst are
+    accessed as (uGNSS.MAXSAT, 4) arrays, the satellites without data are
+    NaN for pos/vel and zero for std/vst.
+    """
+
+    def __init__(self, time=None, rows=None):
         if time is not None:
             self.time = time
         else:
             self.time = gtime_t()
-        self.pos = np.ones((uGNSS.MAXSAT, 4))*np.nan
-        self.vel = np.ones((uGNSS.MAXSAT, 4))*np.nan
-        self.std = np.zeros((uGNSS.MAXSAT, 4))
-        self.vst = np.zeros((uGNSS.MAXSAT, 4))
+        self.rows = rows if rows is not None else peph_sats()
+        self.val = [None, None, None, None]  # pos, vel, std, vst
+
+    def block(self, i):
+        """ block of values i for all rows, allocated or extended if needed """
+        n = len(self.rows)
+        v = self.val[i]
+        if v is None or len(v) < n:
+            # extend with margin for the rows added one by one
+            nv = n if v is None else max(n, min(2*len(v), uGNSS.MAXSAT))
+            v_ = np.full((nv, 4), PEPH_FILL[i])
+            if v is not None:
+                v_[:len(v)] = v
+            self.val[i] = v = v_
+        return v
+
+    def get_row(self, i, sat):
+        """ values i of sat """
+        k = self.rows.idx[sat-1]
+        v = self.val[i]
+        if k < 0 or v is None or k >= len(v):
+            return np.full(4, PEPH_FILL[i])
+        return v[k]
+
+    def get(self, i, sats):
+        """ values i of satellites sats, (len(sats), 4) """
+        sats = np.asarray(sats)
+        out = np.full((len(sats), 4), PEPH_FILL[i])
+        v = self.val[i]
+        if v is None:
+            return out
+        k = self.rows.idx[sats-1]
+        ok = (k >= 0) & (k < len(v))
+        out[ok] = v[k[ok]]
+        return out
+
+    def toarray(self, i):
+        """ values i as (uGNSS.MAXSAT, 4) array """
+        a = np.full((uGNSS.MAXSAT, 4), PEPH_FILL[i])
+        v = self.val[i]
+        if v is not None:
+            n = min(len(v), len(self.rows))
+            a[np.array(self.rows.sat[:n], dtype=int)-1] = v[:n]
+        return a
+
+    def set_array(self, i, a):
+        """ set values i from (uGNSS.MAXSAT, 4) array """
+        a = np.asarray(a)
+        fill = np.isnan(a) if np.isnan(PEPH_FILL[i]) else a == PEPH_FILL[i]
+        for sat in np.flatnonzero(~fill.all(axis=1))+1:
+            self.rows.add(int(sat))
+        self.val[i] = None
+        v = self.block(i)
+        k = self.rows.idx[:]
+        v[k[k >= 0]] = a[k >= 0]
+
+    @property
+    def pos(self):
+        return peph_val(self, PEPH_POS)
+
+    @pos.setter
+    def pos(self, a):
+        self.set_array(PEPH_POS, a)
+
+    @property
+    def vel(self):
+        return peph_val(self, PEPH_VEL)
+
+    @vel.setter
+    def vel(self, a):
+        self.set_array(PEPH_VEL, a)
+
+    @property
+    def std(self):
+        return peph_val(self, PEPH_STD)
+
+    @std.setter
+    def std(self, a):
+        self.set_array(PEPH_STD, a)
+
+    @property
+    def vst(self):
+        return peph_val(self, PEPH_VST)
+
+    @vst.setter
+    def vst(self, a):
+        self.set_array(PEPH_VST, a)
 
 
 class peph:
@@ -45,6 +207,7 @@ class peph:
     def __init__(self):
         self.t = None
         self.nmax = 24*12
+        self.tcache = {}  # times of epochs of precise ephemeris/clocks
 
     def parse_satlist(self, line):
         n = len(line[9:60])//3
@@ -62,10 +225,11 @@ class peph:
                 self.acc[self.cnt] = acc
             self.cnt += 1
 
-    def parse_sp3(self, fname, nav, opt=0):
+    def parse_sp3(self, fname, nav, opt=0, fast=True):
         ver_t = ['c', 'd']
         self.status = 0
         v = False
+        rows = None
         with open(fname, "r") as fh:
             for line in fh:
                 if line[0:3] == 'EOF':  # end of record
@@ -74,6 +238,10 @@ class peph:
                     continue
                 if line[0:2] == '* ':  # header of body part
                     self.status = 10
+                    if fast:
+                        if self.parse_sp3_body(line+fh.read(), nav, opt):
+                            return nav
+                        return self.parse_sp3(fname, nav, opt, fast=False)
 
                 if self.status == 0:
                     if line[0] != '#':
@@ -137,7 +305,9 @@ class peph:
                         v = False
                         nav.ne += 1
                         self.cnt = 0
-                        peph = peph_t(str2time(line, 3, 27))
+                        if rows is None:  # rows of the satellites in header
+                            rows = peph_sats(int(sat) for sat in self.sat if sat > 0)
+                        peph = peph_t(str2time(line, 3, 27), rows)
                         # ep = time2epoch(peph.time)
                         # print("{:4.0f}/{:02.0f}/{:02.0f} {:2.0f}:{:2.0f}:{:5.2f}"
                         #       .format(ep[0], ep[1], ep[2], ep[3], ep[4], ep[5]))
@@ -150,6 +320,7 @@ class peph:
 
                             svid = line[1:4]
                             sat_ = id2sat(svid)
+                            k = rows.add(sat_ if sat_ > 0 else uGNSS.MAXSAT+sat_)
 
                             # clk_ev   = line[74] # clock event flag
                             # clk_pred = line[75] # clock pred. flag
@@ -174,9 +345,9 @@ class peph:
                                     scl = 1e3 if j < 3 else 1e-6
                                     if line[0] == 'P':
                                         v = True
-                                        peph.pos[sat_-1, j] = val*scl
+                                        peph.block(PEPH_POS)[k, j] = val*scl
                                     elif v:
-                                        peph.vel[sat_-1, j] = val*scl*1e-4
+                                        peph.block(PEPH_VEL)[k, j] = val*scl*1e-4
 
                             if len(line) >= 74:
                                 for j in range(4):
@@ -189,14 +360,203 @@ class peph:
                                     if self.scl[ofst] > 0.0 and std > 0.0:
                                         v = pow(self.scl[ofst], std)*scl
                                         if line[0] == 'P':
-                                            peph.std[sat_-1, j] = v
+                                            peph.block(PEPH_STD)[k, j] = v
                                         else:
-                                            peph.vst[sat_-1, j] = v*1e-4
+                                            peph.block(PEPH_VST)[k, j] = v*1e-4
                     if v:
                         nav.peph.append(peph)
 
         return nav
 
+    def parse_sp3_body(self, text, nav, opt=0):
+        """
+        Parse data section of SP3 file at once (fast path of parse_sp3)
+
+        The records are sliced at the fixed columns of all lines and
+        converted by NumPy into (epochs, satellites, 4) arrays, which are
+        shared by the peph_t of the epochs.  Returns False without storing
+        anything if the layout is not regular (each epoch with the records
+        of all satellites of the header), parse_sp3() is used then.
+        """
+        lines = text.encode('latin-1').split(b'\n')
+        nlen = np.array([len(s)+1 for s in lines])  # length including '\n'
+        nlen[-1] -= 1
+        U = np.array(lines, dtype='S80').view('uint8').reshape(-1, 80)
+
+        nline = self.nsat if self.flag == 'P' else self.nsat*2
+        H = np.flatnonzero((U[:, 0] == ord('*')) & (U[:, 1] == ord(' ')))
+        e = H[-1]+nline+1 if len(H) > 0 else 0
+        if len(H) == 0 or H[0] != 0 or np.any(np.diff(H) != nline+1) or \
+                e >= len(lines) or not (lines[e][0:3] == b'EOF' or
+                                        (e == len(lines)-1 and lines[e] == b'')):
+            return False
+        nep = len(H)
+        B = (H[:, None]+1+np.arange(nline)).ravel()  # records
+        ep = np.repeat(np.arange(nep), nline)
+        isP = U[B, 0] == ord('P')
+        isV = U[B, 0] == ord('V')
+        if not np.all(isP | isV):
+            return False
+
+        # satellites
+        svid, inv = np.unique(U[B, 1:4].copy().view('S3').ravel(),
+                              return_inverse=True)
+        rows = peph_sats(int(sat) for sat in self.sat if sat > 0)
+        k_ = np.zeros(len(svid), dtype=int)
+        for i in np.unique(inv, return_index=True)[1]:  # order of appearance
+            sat_ = id2sat(svid[inv[i]].decode('latin-1'))
+            k_[inv[i]] = rows.add(sat_ if sat_ > 0 else uGNSS.MAXSAT+sat_)
+        row = k_[inv]
+        nrow = len(rows)
+        for m in (isP, isV):
+            key = ep[m]*nrow+row[m]
+            if len(np.unique(key)) != len(key):  # duplicated records
+                return False
+
+        # x,y,z[km],clock[usec]
+        try:
+            val = U[B, 4:60].copy().view('S14').astype(float)
+        except ValueError:
+            return False
+        L = nlen[B]
+        pred_c = (L >= 76) & (U[B, 75] == ord('P'))
+        pred_o = (L >= 80) & (U[B, 79] == ord('P'))
+        ok = np.abs(val-999999.999999) >= 1e-6
+        if opt & 1:
+            ok[:, 0:3] &= ~pred_o[:, None]
+            ok[:, 3] &= ~pred_c
+        if opt & 2:
+            ok[:, 0:3] &= pred_o[:, None]
+            ok[:, 3] &= pred_c
+        val = val*np.array([1e3, 1e3, 1e3, 1e-6])
+
+        # std-dev [mm] or [psec] as exponent of base
+        std = np.zeros((len(B), 4))
+        std_ok = np.zeros((len(B), 4), dtype=bool)
+        has = L >= 74
+        for j in range(4):
+            slen, scl, ofst = (2, 1e-3, 0) if j < 3 else (3, 1e-12, 1)
+            C = U[B, 61+j*3:61+j*3+slen].astype(int)
+            dig = (C >= ord('0')) & (C <= ord('9'))
+            blank = C[:, -1] == ord(' ')
+            bad = ~(dig | (C == ord(' '))).all(axis=1) | \
+                (np.maximum.accumulate(dig, axis=1) & (C == ord(' '))).any(axis=1)
+            if np.any(has & ~blank & bad):
+                return False
+            n_ = (np.where(dig, C-ord('0'), 0)*10**np.arange(slen-1, -1, -1)).sum(axis=1)
+            n_[blank] = 0
+            if self.scl[ofst] > 0.0:
+                tbl = np.array([pow(self.scl[ofst], x) for x in range(10**slen)])*scl
+                std_ok[:, j] = has & (n_ > 0)
+                std[:, j] = tbl[n_]
+
+        # records counted as valid data of the epoch
+        flg = (isP & ok.any(axis=1)) | std_ok.any(axis=1)
+        cnt = np.cumsum(flg.reshape(nep, nline), axis=1).ravel()-flg
+        stored = flg.reshape(nep, nline).any(axis=1)
+
+        val3 = [None, None, None, None]
+        for i, m_, v_, x_ in ((PEPH_POS, isP[:, None] & ok, val, 1.0),
+                              (PEPH_VEL, (isV & (cnt > 0))[:, None] & ok, val, 1e-4),
+                              (PEPH_STD, isP[:, None] & std_ok, std, 1.0),
+                              (PEPH_VST, isV[:, None] & std_ok, std, 1e-4)):
+            if not np.any(m_):
+                continue
+            a = np.full((nep, nrow, 4), PEPH_FILL[i])
+            r = m_.any(axis=1)
+            sub = a[ep[r], row[r]]
+            sub[m_[r]] = v_[r][m_[r]]*x_ if x_ != 1.0 else v_[r][m_[r]]
+            a[ep[r], row[r]] = sub
+            val3[i] = a
+
+        for k in range(nep):
+            nav.ne += 1
+            if not stored[k]:
+                continue
+            peph = peph_t(str2time(lines[H[k]].decode('latin-1'), 3, 27), rows)
+            for i in range(4):
+                if val3[i] is not None:
+                    peph.val[i] = val3[i][k]
+            nav.peph.append(peph)
+        return True
+
+    def write_sp3_header(self, fh, t0, tstep, ne):
+        """
+        Write header section of SP3 file
+        """
+
+        # Epoch lines
+        #
+        e = time2epoch(t0)
+
+        fh.write("#dP{:04d} {:02d} {:02d} {:02d} {:02d} {:011.8f} {:7d} d+D {:16s}\n"
+                 .format(e[0], e[1], e[2], e[3], e[4], e[5], ne, ' '))
+
+        week, secs = time2gpst(t0)
+        mjd = 44244 + 7*week + int(secs/86400.0)
+        fod = time2doy(t0) % 1
+
+        fh.write("## {:04d} {:15.8f} {:14.8f} {:5n} {:15.13f}\n"
+                 .format(week, secs, tstep, mjd, fod))
+
+        # Satellite list and accuracy indicators
+        #
+        self.sat=sorted(self.sat)
+        self.nsat=len(self.sat)
+        for i in range(int(np.ceil(self.nsat / 17))):
+
+            nsat = "{:4n}".format(self.nsat) if i == 0 else "    "
+            prns = [sat2id(s) for s in self.sat[i*17:i*17+17]]
+            fh.write('+ {}   {:51s}\n'.format(nsat, ''.join(prns)))
+
+        for i in range(int(self.nsat / 17+1)):
+
+            accs = ['  0' for s in self.sat[i*17:i*17+17]]
+            fh.write('++{}   {:51s}\n'.format('    ', ''.join(accs)))
+
+        fh.write(
+            '%c M  cc GPS ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc\n')
+        fh.write(
+            '%c cc cc ccc ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc\n')
+
+        fh.write(
+            '%f  1.2500000  1.025000000  0.00000000000  0.000000000000000\n')
+        fh.write(
+            '%f  0.0000000  0.000000000  0.00000000000  0.000000000000000\n')
+        fh.write(
+            '%i    0    0    0    0      0      0      0      0         0\n')
+        fh.write(
+            '%i    0    0    0    0      0      0      0      0         0\n')
+
+        # Comment section
+        #
+        fh.write('/* \n')
+
+    def write_sp3_epoch(self, fh, peph, sats=None):
+        """
+        Write one epoch of data section of SP3 file for satellites sats
+        (None: satellite list of header)
+        """
+        e = time2epoch(peph.time)
+        lines = ["*  {:04d} {:02d} {:02d} {:02d} {:02d} {:011.8f}\n"
+                 .format(e[0], e[1], e[2], e[3], e[4], e[5])]
+
+        for sat in (self.sat if sats is None else sats):
+
+            if np.isnan(peph.pos[sat-1][0:3]).any():
+                continue
+
+            clk = 0.999999999999 \
+                if np.isnan(peph.pos[sat-1][3]) else peph.pos[sat-1][3]
+
+            lines.append("P{:3s} {:13.6f} {:13.6f} {:13.6f} {:13.6f}\n"
+                         .format(sat2id(sat),
+                                 peph.pos[sat-1][0]*1e-3,
+                                 peph.pos[sat-1][1]*1e-3,
+                                 peph.pos[sat-1][2]*1e-3,
+                                 clk*1e+6))
+        fh.write(''.join(lines))
+
     def write_sp3(self, fname, nav):
         """
         Write data to SP3 file
@@ -206,84 +566,239 @@ class peph:
 
             # Write header section
             #
-
-            # Epoch lines
-            #
             t0 = nav.peph[0].time
-            e = time2epoch(t0)
-            ne = len(nav.peph)
-
-            fh.write("#dP{:04d} {:02d} {:02d} {:02d} {:02d} {:011.8f} {:7d} d+D {:16s}\n"
-                     .format(e[0], e[1], e[2], e[3], e[4], e[5], ne, ' '))
-
-            week, secs = time2gpst(t0)
             tstep = timediff(nav.peph[1].time, t0)
-            mjd = 44244 + 7*week + int(secs/86400.0)
-            fod = time2doy(t0) % 1
-
-            fh.write("## {:04d} {:15.8f} {:14.8f} {:5n} {:15.13f}\n"
-                     .format(week, secs, tstep, mjd, fod))
-
-            # Satellite list and accuracy indicators
-            #
-            self.sat=sorted(self.sat)
-            self.nsat=len(self.sat)
-            for i in range(int(np.ceil(self.nsat / 17))):
-
-                nsat = "{:4n}".format(self.nsat) if i == 0 else "    "
-                prns = [sat2id(s) for s in self.sat[i*17:i*17+17]]
-                fh.write('+ {}   {:51s}\n'.format(nsat, ''.join(prns)))
-
-            for i in range(int(self.nsat / 17+1)):
-
-                accs = ['  0' for s in self.sat[i*17:i*17+17]]
-                fh.write('++{}   {:51s}\n'.format('    ', ''.join(accs)))
-
-            fh.write(
-                '%c M  cc GPS ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc\n')
-            fh.write(
-                '%c cc cc ccc ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc\n')
-
-            fh.write(
-                '%f  1.2500000  1.025000000  0.00000000000  0.000000000000000\n')
-            fh.write(
-                '%f  0.0000000  0.000000000  0.00000000000  0.000000000000000\n')
-            fh.write(
-                '%i    0    0    0    0      0      0      0      0         0\n')
-            fh.write(
-                '%i    0    0    0    0      0      0      0      0         0\n')
-
-            # Comment section
-            #
-            fh.write('/* \n')
+            self.write_sp3_header(fh, t0, tstep, len(nav.peph))
 
             # Write data section
             #
             for peph in nav.peph:
+                self.write_sp3_epoch(fh, peph)
 
-                e = time2epoch(peph.time)
+            # Terminate file
+            #
+            fh.write('EOF\n')
 
-                fh.write("*  {:04d} {:02d} {:02d} {:02d} {:02d} {:011.8f}\n"
-                         .format(e[0], e[1], e[2], e[3], e[4], e[5]))
+    def epoch_time(self, pephs):
+        """
+        times of epochs of pephs (peph_t or pclk_t) as integer and fraction
+        of second, cached until the list is changed
+        """
+        c = self.tcache.get(id(pephs))
+        if c is None or c[0] is not pephs or len(c[1]) != len(pephs):
+            tt = np.array([p.time.time for p in pephs], dtype='int64')
+            ts = np.array([p.time.sec for p in pephs], dtype=float)
+            c = (pephs, tt, ts, tt-tt[0]+ts if len(tt) > 0 else ts, {})
+            self.tcache[id(pephs)] = c
+        return c
+
+    def search_epoch(self, time, pephs):
+        """
+        index of epoch before time by binary search, returns index, time
+        difference of epochs from time and window cache
+        """
+        _, tt, ts, tr, win = self.epoch_time(pephs)
+        i = np.searchsorted(tr, (time.time-tt[0])+time.sec, 'left')
+        index = min(max(i-1, 0), len(tr)-2)
+        dt = (tt-time.time)+(ts-time.sec)  # t(epoch)-time
+        return index, dt, win
 
-                for sat in self.sat:
+    def pephpos(self, time, sats, nav, var=False):
+        """
+        satellite positions/clocks of sats at time by precise ephemeris
 
-                    if np.isnan(peph.pos[sat-1][0:3]).any():
-                        continue
+        Orbits are interpolated by Lagrange polynomial of NMAX+1 epochs,
+        common to all satellites, and clocks linearly.  Returns rs (n x 3),
+        dts (n), vare (n), varc (n), None if time is out of the ephemeris.
+        """
+        n = len(nav.peph)
+        if n < NMAX+1:
+            return None, None, None, None
+        index, dt, win = self.search_epoch(time, nav.peph)
+        if dt[0] > MAXDTE or dt[-1] < -MAXDTE:
+            return None, None, None, None
+
+        # Lagrange interpolation of orbit with window of NMAX+1 epochs
+        i = min(max(index-(NMAX+1)//2, 0), n-NMAX-1)
+        t = dt[i:i+NMAX+1]
+        w = win.get(i)
+        if w is None:  # barycentric weights of window
+            tw = t-t[0]
+            d = tw[:, None]-tw[None, :]
+            np.fill_diagonal(d, 1.0)
+            w = win[i] = 1.0/np.prod(d, axis=1)
+        k = np.flatnonzero(t == 0.0)
+        if len(k) > 0:  # time at epoch
+            c = np.zeros(NMAX+1)
+            c[k[0]] = 1.0
+        else:
+            c = w/-t
+            c *= np.prod(-t)
+
+        p = np.array([nav.peph[i+j].get(PEPH_POS, sats) for j in range(NMAX+1)])
+        # correction for earth rotation from epoch to time
+        sinl = np.sin(rCST.OMGE*t)[:, None]
+        cosl = np.cos(rCST.OMGE*t)[:, None]
+        rs = np.column_stack([c@(cosl*p[:, :, 0]-sinl*p[:, :, 1]),
+                              c@(sinl*p[:, :, 0]+cosl*p[:, :, 1]),
+                              c@p[:, :, 2]])
+
+        vare = np.zeros(len(rs))
+        if var:
+            std = np.linalg.norm(nav.peph[index].get(PEPH_STD, sats)[:, 0:3], axis=1)
+            # extrapolation error for orbit
+            if t[0] > 0.0:
+                std += EXTERR_EPH*t[0]**2/2.0
+            elif t[-1] < 0.0:
+                std += EXTERR_EPH*t[-1]**2/2.0
+            vare = std**2
+
+        # linear interpolation of clock
+        c0 = nav.peph[index].get(PEPH_POS, sats)[:, 3]
+        c1 = nav.peph[index+1].get(PEPH_POS, sats)[:, 3]
+        s0 = nav.peph[index].get(PEPH_STD, sats)[:, 3]
+        s1 = nav.peph[index+1].get(PEPH_STD, sats)[:, 3]
+        dts, varc = self.interp_clk(-dt[index], -dt[index+1], c0, c1, s0, s1)
+        return rs, dts, vare, varc
+
+    def interp_clk(self, t0, t1, c0, c1, s0, s1):
+        """
+        linear interpolation of clocks c0, c1 [s] at t0, t1 [s] after the
+        epochs, extrapolation outside of the epochs.  Returns dts, varc.
+        """
+        if t0 <= 0.0:
+            dts = c0.copy()
+            std = s0*rCST.CLIGHT-EXTERR_CLK*t0
+        elif t1 >= 0.0:
+            dts = c1.copy()
+            std = s1*rCST.CLIGHT+EXTERR_CLK*t1
+        else:
+            dts = (c1*t0-c0*t1)/(t0-t1)
+            std = (s0 if t0 < -t1 else s1)*rCST.CLIGHT + \
+                EXTERR_CLK*min(abs(t0), abs(t1))
+        return dts, std**2
 
-                    clk = 0.999999999999 \
-                        if np.isnan(peph.pos[sat-1][3]) else peph.pos[sat-1][3]
+    def pephclk(self, time, sats, nav):
+        """
+        satellite clocks of sats at time by clock RINEX (nav.pclk)
 
-                    fh.write("P{:3s} {:13.6f} {:13.6f} {:13.6f} {:13.6f}\n"
-                             .format(sat2id(sat),
-                                     peph.pos[sat-1][0]*1e-3,
-                                     peph.pos[sat-1][1]*1e-3,
-                                     peph.pos[sat-1][2]*1e-3,
-                                     clk*1e+6))
+        Returns dts (n), varc (n), None if time is out of the clocks.
+        """
+        if nav.nc < 2:
+            return None, None
+        index, dt, _ = self.search_epoch(time, nav.pclk)
+        if dt[0] > MAXDTE or dt[-1] < -MAXDTE:
+            return None, None
+        sats = np.asarray(sats)-1
+        c0 = nav.pclk[index].clk[sats]
+        c1 = nav.pclk[index+1].clk[sats]
+        dts, varc = self.interp_clk(
+            -dt[index], -dt[index+1], np.where(c0 != 0.0, c0, np.nan),
+            np.where(c1 != 0.0, c1, np.nan), nav.pclk[index].std[sats],
+            nav.pclk[index+1].std[sats])
+        return dts, varc
+
+    def peph2pos(self, time, sat, nav, var=False):
+        """
+        satellite position, velocity and clock by precise ephemeris
+
+        Parameters
+        ----------
+        time : gtime_t
+            time (GPST)
+        sat : int or np.array() of int
+            satellite number(s)
+        nav : Nav()
+            precise ephemeris nav.peph (parse_sp3()) and clocks nav.pclk
+
+        Returns
+        -------
+        rs : np.array() of float
+            satellite position and velocity in ECEF [m], [m/s] (6) or (n x 6)
+        dts : np.array() of float
+            satellite clock offset and drift [s], [s/s] (2) or (n x 2),
+            NaN if the clock is not available
+        var : float or np.array() of float
+            variance of position and clock [m^2]
+
+        None, None, None if time is out of the precise ephemeris.
+        """
+        tt = 1e-3
+        sats = np.atleast_1d(sat)
+        rss, dtss, vare, varc = self.pephpos(time, sats, nav, var)
+        if rss is None:
+            return None, None, None
+        time_tt = timeadd(time, tt)
+        rst, dtst, _, _ = self.pephpos(time_tt, sats, nav)
+        if rst is None:
+            return None, None, None
+        if nav.nc >= 2:
+            dtss, varc = self.pephclk(time, sats, nav)
+            dtst, _ = self.pephclk(time_tt, sats, nav)
+            if dtss is None or dtst is None:
+                return None, None, None
+
+        rs = np.hstack([rss, (rst-rss)/tt])
+        dts = np.column_stack([dtss, (dtst-dtss)/tt])
+        var_ = vare+varc
+        if np.ndim(sat) == 0:
+            return rs[0], dts[0], var_[0]
+        return rs, dts, var_
+
+
+class sp3_writer(peph):
+    """
+    Streaming writer of SP3 file
+
+    Each epoch is written by write_epoch() as soon as it is produced, so
+    the epochs are not kept in memory.  The data section is written to
+    fname+'.part' and the header, which needs the satellite list and the
+    number of epochs of the whole file, is written at close().  Used with
+    'with', the file is completed with the epochs written so far also if
+    the processing is stopped by an exception, and no part file is left.
+    """
+
+    def __init__(self, fname):
+        super().__init__()
+        self.fname = fname
+        self.sat = []
+        self.fh = None
+        self.t0 = None
+        self.tstep = 0.0
+        self.ne = 0
+
+    def write_epoch(self, peph):
+        """ write one epoch of satellite positions/clocks (peph_t) """
+        if self.fh is None:
+            self.fh = open(self.fname+'.part', 'w')
+        if self.ne == 0:
+            self.t0 = peph.time
+        elif self.ne == 1:
+            self.tstep = timediff(peph.time, self.t0)
+        self.write_sp3_epoch(self.fh, peph, sorted(self.sat))
+        self.ne += 1
+
+    def close(self):
+        """ write header and data section to SP3 file """
+        if self.fh is None:
+            return
+        self.fh.close()
+        self.fh = None
+        try:
+            with open(self.fname, "w") as fh:
+                self.write_sp3_header(fh, self.t0, self.tstep, self.ne)
+                with open(self.fname+'.part', 'r') as fp:
+                    shutil.copyfileobj(fp, fh)
+                fh.write('EOF\n')
+        finally:
+            os.remove(self.fname+'.part')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
-            # Terminate file
-            #
-            fh.write('EOF\n')
 
 def Rx(t):
     ct, st = cos(t), sin(t)
@@ -0,0 +1,172 @@
+"""
+module for reading Septentrio Binary Format (SBF) blocks GALRawCNAV (4024)
+and BDSRawB2b (4242)
+
+[1] Septentrio, mosaic-X5 Reference Guide, SBF Reference
+
+The blocks are framed from a file or a byte stream, the CRC is checked and
+the navigation bits are stored as bytes, so that no text export of the
+blocks is needed.  The records have the same fields tow, wn, prn and nav
+as the text export read by sbf_txt.read_sbf_txt().
+"""
+
+import struct
+from binascii import crc_hqx
+import numpy as np
+from B2b_HAS_decoder.sbf_txt import SBF_STAT
+
+SBF_SYNC = b'$@'
+SBF_HLEN = 8  # Sync(2), CRC(2), ID(2), Length(2)
+
+ID_GALRawCNAV = 4024
+ID_BDSRawB2b = 4242
+
+CHUNK_SIZE = 20000  # default number of records per chunk
+READ_SIZE = 1 << 20  # bytes read from file at a time
+
+# number of 32-bit NAVBits words per block
+NAV_WORDS = {ID_GALRawCNAV: 16, ID_BDSRawB2b: 31}
+
+# record formats, nav: navigation bits (MSB first)
+dtype_GALRawCNAV = [('tow', 'float64'), ('wn', 'int'), ('prn', 'int'),
+                    ('signal', 'int'), ('nav', 'u1', (4*NAV_WORDS[ID_GALRawCNAV],))]
+
+dtype_BDSRawB2b = [('tow', 'float64'), ('wn', 'int'), ('prn', 'int'),
+                   ('signal', 'int'), ('nav', 'u1', (4*NAV_WORDS[ID_BDSRawB2b],))]
+
+dtype_blk = {ID_GALRawCNAV: dtype_GALRawCNAV, ID_BDSRawB2b: dtype_BDSRawB2b}
+
+def crc16(data):
+    """ CRC-16-CCITT (polynomial 0x1021, initial value 0) of SBF block [1] """
+    return crc_hqx(data, 0)
+
+def svid2prn(svid):
+    """ SBF SVID to PRN of Galileo/BDS """
+    if 71 <= svid <= 106:  # Galileo
+        return svid - 70
+    if 141 <= svid <= 180:  # BDS C01-C40
+        return svid - 140
+    if 223 <= svid <= 245:  # BDS C41-C63
+        return svid - 182
+    return 0
+
+
+class sbf_framer:
+    """
+    Framer of SBF blocks from a byte stream
+
+    Bytes are passed by input() in pieces of any size.  Complete blocks
+    with valid CRC are returned as (block ID, block bytes), incomplete
+    blocks are kept until the rest is received.
+    """
+
+    def __init__(self, blk_ids=None):
+        self.buff = b''
+        self.blk_ids = blk_ids  # block IDs to be output (None: all)
+        self.nblk = 0
+        self.ncrc_err = 0
+
+    def input(self, data):
+        buff = self.buff + data
+        blks = []
+        i = 0
+        n = len(buff)
+        while True:
+            i = buff.find(SBF_SYNC, i)
+            if i < 0:
+                i = n - 1 if buff[-1:] == SBF_SYNC[:1] else n
+                break
+            if n - i < SBF_HLEN:
+                break
+            crc, id_, len_ = struct.unpack_from('<HHH', buff, i + 2)
+            if len_ < SBF_HLEN or len_ % 4 != 0:
+                i += 1
+                continue
+            if n - i < len_:
+                break
+            blk = buff[i:i + len_]
+            if crc16(blk[4:]) != crc:
+                self.ncrc_err += 1
+                i += 1
+                continue
+            self.nblk += 1
+            blk_id = id_ & 0x1FFF
+            if self.blk_ids is None or blk_id in self.blk_ids:
+                blks.append((blk_id, blk))
+            i += len_
+        self.buff = buff[i:]
+        return blks
+
+
+def decode_sbf_blk(blk_id, blk):
+    """
+    Decode GALRawCNAV or BDSRawB2b block to record tuple
+
+    Returns None if the navigation bits did not pass the CRC of the
+    signal or the block is too short.
+    """
+    nw = NAV_WORDS[blk_id]
+    if len(blk) < SBF_HLEN + 12 + 4*nw:
+        return None
+    tow, wn, svid, crc_passed, _, src = struct.unpack_from('<IHBBBB', blk, 8)
+    if crc_passed == 0 or tow == 0xFFFFFFFF or wn == 0xFFFF:
+        return None
+    # NAVBits: u4 words, first bit in MSB of the first word
+    nav = np.frombuffer(blk, dtype='<u4', count=nw, offset=20).astype('>u4')
+    return (tow*1e-3, wn, svid2prn(svid), src & 0x1F,
+            np.frombuffer(nav.tobytes(), dtype='u1'))
+
+
+def read_sbf(fname, blk_id, prn=None, chunk_size=CHUNK_SIZE, by_epoch=False):
+    """
+    Read GALRawCNAV or BDSRawB2b blocks of SBF file in chunks
+
+    Parameters
+    ----------
+    fname : str
+        SBF file (e.g. SEPT1350.24_)
+    blk_id : int
+        block ID, ID_GALRawCNAV or ID_BDSRawB2b
+    prn : int
+        satellite PRN to be selected (None: all satellites)
+    chunk_size : int
+        number of records per chunk
+    by_epoch : bool
+        keep each epoch in one chunk as read_sbf_txt().  Late records are
+        skipped and counted in SBF_STAT['late'].
+
+    Returns
+    -------
+    generator of np.array() of dtype_blk[blk_id]
+        records with valid navigation bits in the order of the file.
+        Without by_epoch, a chunk ends at a change of TOW.
+    """
+    dtype = dtype_blk[blk_id]
+    framer = sbf_framer((blk_id,))
+    rec = []
+    tow_max = None  # latest TOW of current chunk
+    tow_out = None  # latest TOW of output chunks
+    tow_p = None
+    with open(fname, 'rb') as fh:
+        while True:
+            data = fh.read(READ_SIZE)
+            if not data:
+                break
+            for id_, blk in framer.input(data):
+                v = decode_sbf_blk(id_, blk)
+                if v is None or (prn is not None and v[2] != prn):
+                    continue
+                if by_epoch and tow_out is not None and v[0] <= tow_out:
+                    SBF_STAT['late'] += 1
+                    continue
+                if len(rec) >= chunk_size and \
+                        (v[0] > tow_max if by_epoch else v[0] != tow_p):
+                    yield np.array(rec, dtype=dtype)
+                    rec = []
+                    tow_out = tow_max
+                rec.append(v)
+                tow_max = v[0] if tow_max is None else max(tow_max, v[0])
+                tow_p = v[0]
+
+    if len(rec) > 0:
+        yield np.array(rec, dtype=dtype)
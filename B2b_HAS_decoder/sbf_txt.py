@@ -0,0 +1,128 @@
+"""
+module for reading SBF blocks exported to text (SBF_GALRawCNAV, SBF_BDSRawB2b)
+
+The text files hold one navigation page per line.  They are parsed in
+fixed-size chunks so that a whole day of 1 Hz data is never held in memory.
+"""
+
+import numpy as np
+
+CHUNK_SIZE = 20000  # default number of records per chunk
+
+# number of records skipped as late for their epoch (by_epoch=True)
+SBF_STAT = {'late': 0}
+
+# record formats of the Septentrio text export
+dtype_GALRawCNAV = [('tow', 'float64'), ('wn', 'int'), ('prn', 'int'),
+                    ('validity', 'S10'), ('mask', 'int'), ('signal', 'S10'),
+                    ('num1', 'int'), ('num2', 'int'), ('nav', 'S278')]
+
+dtype_BDSRawB2b = [('tow', 'float64'), ('wn', 'int'), ('prn', 'int'),
+                   ('validity', 'S10'), ('signal', 'S10'), ('num2', 'int'),
+                   ('nav', 'S278')]
+
+
+def read_sbf_txt(fname, dtype, prn=None, chunk_size=CHUNK_SIZE, by_epoch=False):
+    """
+    Read SBF text export in chunks
+
+    Parameters
+    ----------
+    fname : str
+        SBF text file (e.g. SEPT1350.24__SBF_GALRawCNAV.txt)
+    dtype : list
+        record format, dtype_GALRawCNAV or dtype_BDSRawB2b
+    prn : int
+        satellite PRN to be selected (None: all satellites)
+    chunk_size : int
+        number of records per chunk
+    by_epoch : bool
+        keep each epoch in one chunk for group_epochs().  A chunk ends
+        only when the TOW exceeds the latest TOW of the chunk, so the lines
+        need not be time-ordered.  Records with a TOW not later than the
+        previous chunks are skipped and counted in SBF_STAT['late'].
+
+    Returns
+    -------
+    generator of np.array() of dtype
+        records with validity == Passed, PRN converted to int and
+        whitespace removed from the navigation bits, in the order of the
+        file.  Without by_epoch, a chunk ends at a change of TOW.
+    """
+    names = [d[0] for d in dtype]
+    nf = len(names)
+    i_tow = names.index('tow')
+    i_prn = names.index('prn')
+    i_val = names.index('validity')
+    i_nav = names.index('nav')
+    i_int = [k for k, d in enumerate(dtype) if d[1] == 'int']
+    i_str = [k for k, d in enumerate(dtype) if d[1][0] == 'S' and k != i_nav]
+
+    rec = []
+    tow_max = None  # latest TOW of current chunk
+    tow_out = None  # latest TOW of output chunks
+    tow_p = None
+    with open(fname, 'rb') as fh:
+        for line in fh:
+            if line[:1] == b'#':  # comment
+                continue
+            v = line.rstrip(b'\r\n').split(b',', nf-1)
+            if len(v) < nf or v[i_val].strip() != b'Passed':
+                continue
+            try:
+                prn_ = int(v[i_prn].strip()[1:])
+                if prn is not None and prn_ != prn:
+                    continue
+                tow = float(v[i_tow])
+                for k in i_int:
+                    v[k] = int(v[k]) if k != i_prn else prn_
+            except ValueError:
+                continue
+            if by_epoch and tow_out is not None and tow <= tow_out:
+                SBF_STAT['late'] += 1
+                continue
+            v[i_tow] = tow
+            for k in i_str:
+                v[k] = v[k].strip()
+            v[i_nav] = b''.join(v[i_nav].split())
+
+            if len(rec) >= chunk_size and \
+                    (tow > tow_max if by_epoch else tow != tow_p):
+                yield np.array(rec, dtype=dtype)
+                rec = []
+                tow_out = tow_max
+            rec.append(tuple(v))
+            tow_max = tow if tow_max is None else max(tow_max, tow)
+            tow_p = tow
+
+    if len(rec) > 0:
+        yield np.array(rec, dtype=dtype)
+
+
+def group_epochs(v, key='tow'):
+    """
+    Group records by epoch
+
+    Parameters
+    ----------
+    v : np.array()
+        records read by read_sbf_txt()
+    key : str
+        field name of the epoch
+
+    Returns
+    -------
+    generator of (epoch, np.array())
+        epochs in ascending order and the contiguous slice of records of
+        each epoch.  The record order inside an epoch is kept.
+    """
+    if len(v) == 0:
+        return
+    t = v[key]
+    if np.any(t[1:] < t[:-1]):
+        v = v[np.argsort(t, kind='stable')]
+        t = v[key]
+    tows, idx = np.unique(t, return_index=True)
+    idx = np.append(idx, len(v))
+    for k, tow in enumerate(tows):
+        yield tow, v[idx[k]:idx[k+1]]
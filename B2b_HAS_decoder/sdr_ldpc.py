@@ -2177,23 +2177,45 @@ def decode_LDPC(type, syms):
         return decode_LDPC_IRNV1_SF3(syms)
     return [], -1
 
+# check parity of LDPC code (NB-LDPC only, syms: n or N x n) -------------------
+def check_LDPC(type, syms):
+    if type == 'BCNV1_SF2':
+        return check_NB_LDPC(H_BCNV1_SF2_idx, H_BCNV1_SF2_ele, 100, 200, syms ^ 1)
+    elif type == 'BCNV1_SF3':
+        return check_NB_LDPC(H_BCNV1_SF3_idx, H_BCNV1_SF3_ele, 44, 88, syms ^ 1)
+    elif type == 'BCNV2':
+        return check_NB_LDPC(H_BCNV2_idx, H_BCNV2_ele, 48, 96, syms)
+    elif type == 'BCNV3':
+        return check_NB_LDPC(H_BCNV3_idx, H_BCNV3_ele, 81, 162, syms)
+    return np.zeros(np.shape(syms)[:-1], dtype=bool)
+
+# decode LDPC of multiple frames (N x n) --------------------------------------
+def decode_LDPC_batch(type, syms):
+    syms = np.asarray(syms, dtype='uint8')
+    if type == 'BCNV1_SF2':
+        return decode_NB_LDPC_batch(H_BCNV1_SF2_idx, H_BCNV1_SF2_ele, 100, 200,
+            syms ^ 1)
+    elif type == 'BCNV1_SF3':
+        return decode_NB_LDPC_batch(H_BCNV1_SF3_idx, H_BCNV1_SF3_ele, 44, 88,
+            syms ^ 1)
+    elif type == 'BCNV2':
+        return decode_NB_LDPC_batch(H_BCNV2_idx, H_BCNV2_ele, 48, 96, syms)
+    elif type == 'BCNV3':
+        return decode_NB_LDPC_batch(H_BCNV3_idx, H_BCNV3_ele, 81, 162, syms)
+    H, m, n = get_B_LDPC_H(type)
+    if H is None:
+        return np.zeros((len(syms), 0), dtype='uint8'), np.full(len(syms), -1)
+    return decode_B_LDPC_batch(H, m, n, syms)
+
 # decode LDPC(1200,600) of CNAV-2 subframe 2 -----------------------------------
 def decode_LDPC_CNV2_SF2(syms):
-    global H_CNV2_SF2
-    if not H_CNV2_SF2:
-        H_CNV2_SF2 = gen_B_LDPC_H(600, 1200, 1, H_CNV2_SF2_A, H_CNV2_SF2_B,
-            H_CNV2_SF2_C, H_CNV2_SF2_D, H_CNV2_SF2_E, H_CNV2_SF2_T)
-    
-    return decode_B_LDPC(H_CNV2_SF2, 600, 1200, syms)
+    H, m, n = get_B_LDPC_H('CNV2_SF2')
+    return decode_B_LDPC(H, m, n, syms)
 
 # decode LDPC(548,274) of CNAV-2 subframe 3 ------------------------------------
 def decode_LDPC_CNV2_SF3(syms):
-    global H_CNV2_SF3
-    if not H_CNV2_SF3:
-        H_CNV2_SF3 = gen_B_LDPC_H(274, 548, 1, H_CNV2_SF3_A, H_CNV2_SF3_B,
-            H_CNV2_SF3_C, H_CNV2_SF3_D, H_CNV2_SF3_E, H_CNV2_SF3_T)
-    
-    return decode_B_LDPC(H_CNV2_SF3, 274, 548, syms)
+    H, m, n = get_B_LDPC_H('CNV2_SF3')
+    return decode_B_LDPC(H, m, n, syms)
 
 # decode LDPC(200,100) of B-CNAV1 subframe 2 -----------------------------------
 def decode_LDPC_BCNV1_SF2(syms):
@@ -2213,21 +2235,38 @@ def decode_LDPC_BCNV3(syms):
 
 # decode LDPC(1200,600) of NavIC L1-SPS subframe 2 -----------------------------
 def decode_LDPC_IRNV1_SF2(syms):
-    global H_IRNV1_SF2
-    if not H_IRNV1_SF2:
-        H_IRNV1_SF2 = gen_B_LDPC_H(600, 1200, 50, H_IRNV1_SF2_A, H_IRNV1_SF2_B,
-            H_IRNV1_SF2_C, H_IRNV1_SF2_D, H_IRNV1_SF2_E, H_IRNV1_SF2_T)
-    
-    return decode_B_LDPC(H_IRNV1_SF2, 600, 1200, syms)
+    H, m, n = get_B_LDPC_H('IRNV1_SF2')
+    return decode_B_LDPC(H, m, n, syms)
 
 # decode LDPC(548,274) of NavIC L1-SPS subframe 3 ------------------------------
 def decode_LDPC_IRNV1_SF3(syms):
-    global H_IRNV1_SF3
-    if not H_IRNV1_SF3:
-        H_IRNV1_SF3 = gen_B_LDPC_H(274, 548, 23, H_IRNV1_SF3_A, H_IRNV1_SF3_B,
-            H_IRNV1_SF3_C, H_IRNV1_SF3_D, H_IRNV1_SF3_E, H_IRNV1_SF3_T)
-    
-    return decode_B_LDPC(H_IRNV1_SF3, 274, 548, syms)
+    H, m, n = get_B_LDPC_H('IRNV1_SF3')
+    return decode_B_LDPC(H, m, n, syms)
+
+# get binary LDPC parity check matrix ----------------------------------------
+def get_B_LDPC_H(type):
+    global H_CNV2_SF2, H_CNV2_SF3, H_IRNV1_SF2, H_IRNV1_SF3
+    if type == 'CNV2_SF2':
+        if not H_CNV2_SF2:
+            H_CNV2_SF2 = gen_B_LDPC_H(600, 1200, 1, H_CNV2_SF2_A, H_CNV2_SF2_B,
+                H_CNV2_SF2_C, H_CNV2_SF2_D, H_CNV2_SF2_E, H_CNV2_SF2_T)
+        return H_CNV2_SF2, 600, 1200
+    elif type == 'CNV2_SF3':
+        if not H_CNV2_SF3:
+            H_CNV2_SF3 = gen_B_LDPC_H(274, 548, 1, H_CNV2_SF3_A, H_CNV2_SF3_B,
+                H_CNV2_SF3_C, H_CNV2_SF3_D, H_CNV2_SF3_E, H_CNV2_SF3_T)
+        return H_CNV2_SF3, 274, 548
+    elif type == 'IRNV1_SF2':
+        if not H_IRNV1_SF2:
+            H_IRNV1_SF2 = gen_B_LDPC_H(600, 1200, 50, H_IRNV1_SF2_A,
+                H_IRNV1_SF2_B, H_IRNV1_SF2_C, H_IRNV1_SF2_D, H_IRNV1_SF2_E, H_IRNV1_SF2_T)
+        return H_IRNV1_SF2, 600, 1200
+    elif type == 'IRNV1_SF3':
+        if not H_IRNV1_SF3:
+            H_IRNV1_SF3 = gen_B_LDPC_H(274, 548, 23, H_IRNV1_SF3_A,
+                H_IRNV1_SF3_B, H_IRNV1_SF3_C, H_IRNV1_SF3_D, H_IRNV1_SF3_E, H_IRNV1_SF3_T)
+        return H_IRNV1_SF3, 274, 548
+    return None, 0, 0
 
 # generate binary LDPC parity check matrix -------------------------------------
 def gen_B_LDPC_H(m, n, g, H_A, H_B, H_C, H_D, H_E, H_T):
@@ -2286,3 +2325,40 @@ def decode_B_LDPC(H, m, n, syms):
     
     return dblk[:m], nerr if valid else -1
 
+# decode binary LDPC of multiple frames (N x n) -------------------------------
+def decode_B_LDPC_batch(H, m, n, syms):
+    N = len(syms)
+    dec = np.zeros((N, m), dtype='int8')
+    nerr = np.full(N, -1, dtype=int)
+    if N == 0:
+        return dec, nerr
+    if syms.shape[1] != n:
+        print('decode_LDPC_H: size error (%d %d)' % (n, syms.shape[1]))
+        return dec, nerr
+    
+    lratio = np.zeros(n, dtype='double')
+    dblk   = np.zeros(n, dtype='int8')
+    pchk   = np.zeros(n, dtype='int8')
+    bitpr  = np.zeros(n, dtype='double')
+    p1 = lratio.ctypes.data_as(POINTER(c_double))
+    p2 = dblk.ctypes.data_as(POINTER(c_int8))
+    p3 = pchk.ctypes.data_as(POINTER(c_int8))
+    p4 = bitpr.ctypes.data_as(POINTER(c_double))
+    pH = c_void_p(H)
+    ratio = np.array(RATIO, dtype='double')[syms]
+    
+    # setup decoder
+    max_iter = c_int.in_dll(libldpc, "max_iter")
+    max_iter.value = MAX_ITER
+    libldpc.prprp_decode_setup()
+    libldpc.changed.restype = c_double
+    
+    # decode LDPC by probability propagation
+    for i in range(N):
+        lratio[:] = ratio[i]
+        niter = libldpc.prprp_decode(pH, p1, p2, p3, p4)
+        dec[i] = dblk[:m]
+        if libldpc.check(pH, p2, p3) == 0:
+            nerr[i] = int(libldpc.changed(p1, p2, n))
+    
+    return dec, nerr
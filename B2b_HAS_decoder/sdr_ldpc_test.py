@@ -3,6 +3,7 @@
 #  uinit test for sdr_ldpc.py
 #
 import sys, time
+from concurrent.futures import ProcessPoolExecutor
 sys.path.append('../python')
 import numpy as np
 from B2b_HAS_decoder import sdr_ldpc
@@ -10,6 +11,9 @@ from B2b_HAS_decoder import sdr_nb_ldpc
 import bitstruct as bs
 from binascii import unhexlify,hexlify
 
+# number of clean, corrected and failed B2b frames, invalid HEX strings
+LDPC_STAT = {'clean': 0, 'corrected': 0, 'failed': 0, 'invalid': 0}
+
 # Convert the LDPC(162,91)
 def decode_LDPC(vi_row):
     if isinstance(vi_row['nav'], np.ndarray):
@@ -18,56 +22,117 @@ def decode_LDPC(vi_row):
         buff=vi_row['nav']
     buff=buff.decode('utf-8')
     buff =  buff[:-2]
-    # buff = [item.decode('utf-8') for item in buff]
-    # buff =  buff[0][:-2]
-    length=len(buff)
-    # buff = buff.decode('utf-8')
     SF = read_hex(buff)
     SF=SF[12:]
-    ok, ng = 0, 0
-    t = time.time()
+    return decode_LDPC_syms(SF)
 
-    err_data = SF.copy()
+# decode LDPC(162,81) symbols of B2b frame (972 bits) to message bytes ---------
+def decode_LDPC_syms(SF):
+    # skip iterative decoding if the frame satisfies parity check
+    if sdr_ldpc.check_LDPC('BCNV3', SF):
+        LDPC_STAT['clean'] += 1
+        dec_data = SF[:486]
+    else:
+        err_data = SF.copy()
 
-    dec_data, nerr = sdr_ldpc.decode_LDPC('BCNV3', err_data)
+        dec_data, nerr = sdr_ldpc.decode_LDPC('BCNV3', err_data)
+        if nerr < 0:
+            LDPC_STAT['failed'] += 1
+        else:
+            LDPC_STAT['corrected'] += 1
 
-    if np.all(SF[:486] == dec_data):
-        #print('test_08 (%3d) OK: nerr=%3d' % (n, nerr))
-        ok += 1
-    else:
-        #print('test_08 (%3d) NG: nerr=%3d' % (n, nerr))
-        ng += 1
     hex_txt=hex_str(dec_data)
     if len(hex_txt) % 2 == 1:
         hex_txt += '0'
-    # hex_txt1=hexlify(dec_data).decode('utf-8')
     buff = unhexlify(hex_txt)
     return buff
+
+# decode LDPC(162,81) symbols of B2b frames (N x 972 bits) to message bytes ---
+def decode_LDPC_syms_batch(SF, stat=LDPC_STAT):
+    dec_data = np.array(SF[:, :486], dtype='uint8')
+    
+    # iterative decoding only for frames not satisfying parity check
+    ok = sdr_ldpc.check_LDPC('BCNV3', SF)
+    stat['clean'] += int(np.count_nonzero(ok))
+    if not np.all(ok):
+        dec, nerr = sdr_ldpc.decode_LDPC_batch('BCNV3', SF[~ok])
+        dec_data[~ok] = dec
+        stat['failed'] += int(np.count_nonzero(nerr < 0))
+        stat['corrected'] += int(np.count_nonzero(nerr >= 0))
+    
+    buffs = []
+    for data in dec_data:
+        hex_txt=hex_str(data)
+        if len(hex_txt) % 2 == 1:
+            hex_txt += '0'
+        buffs.append(unhexlify(hex_txt))
+    return buffs
+
+# decode B2b frames in worker process -----------------------------------------
+def decode_LDPC_chunk(SF):
+    stat = {'clean': 0, 'corrected': 0, 'failed': 0}
+    return decode_LDPC_syms_batch(SF, stat), stat
+
+# decode B2b frames (N x 972 bits) by process pool (order preserved) ----------
+def decode_LDPC_syms_pool(SF, executor=None, chunk_size=256):
+    if executor is None:
+        return decode_LDPC_syms_batch(SF)
+    chunks = [SF[i:i+chunk_size] for i in range(0, len(SF), chunk_size)]
+    buffs = []
+    for buff, stat in executor.map(decode_LDPC_chunk, chunks):
+        buffs += buff
+        for key in stat:
+            LDPC_STAT[key] += stat[key]
+    return buffs
+
+# hex character to nibble table ------------------------------------------------
+HEX_CHR = np.frombuffer(b'0123456789ABCDEF', dtype='uint8')
+HEX_VAL = np.full(256, 255, dtype='uint8')
+HEX_VAL[HEX_CHR] = np.arange(16)
+HEX_VAL[np.frombuffer(b'abcdef', dtype='uint8')] = np.arange(10, 16)
+
 # pack bits to uint8 ndarray ---------------------------------------------------
 def pack_bits(data, nz=0):
     if nz > 0:
         data = np.hstack([[0] * nz, data])
-    N = len(data)
-    buff = np.zeros((N + 7) // 8, dtype='uint8')
-    for i in range(N):
-        buff[i // 8] |= (data[i] << (7 - i % 8))
-    return buff
+    return np.packbits(np.asarray(data, dtype='uint8'))
 
 # read HEX strings -------------------------------------------------------------
 def read_hex(str0):
-    N = len(str0) * 4
-    data = np.zeros(N, dtype='uint8')
-    for i in range(N):
-        data[i] = (int(str0[i // 4], 16) >> (3 - i % 4)) & 1
-    return data
+    return read_hex_batch([str0])[0]
+
+# read HEX strings of frames to bit matrix (N x 4*len) ------------------------
+#   mask=True: strings of other length than the most common one or with
+#   invalid characters are returned as zero rows, returns (bits, valid mask)
+def read_hex_batch(strs, mask=False):
+    strs = np.asarray(strs)
+    if strs.dtype.kind == 'U':
+        strs = np.char.encode(strs, 'ascii')
+    N = len(strs)
+    n = np.char.str_len(strs.astype('S'))
+    if mask:
+        L = int(np.bincount(n).argmax()) if N > 0 else 0
+    else:
+        L = int(n.max()) if N > 0 else 0
+    ok = n == L
+    if L == 0:
+        data = np.zeros((N, 0), dtype='uint8')
+        return (data, ok) if mask else data
+    if not mask and not np.all(ok):
+        raise ValueError('HEX strings of different length')
+    strs = strs.astype('S%d' % L)
+    nib = HEX_VAL[np.frombuffer(strs.tobytes(), dtype='uint8').reshape(N, L)]
+    bad = np.any(nib == 255, axis=1)
+    if not mask and np.any(bad):
+        raise ValueError('invalid HEX character')
+    ok &= ~bad
+    nib[~ok] = 0
+    data = np.unpackbits(nib[:, :, None], axis=2)[:, :, 4:].reshape(N, L * 4)
+    return (data, ok) if mask else data
 
 # data to HEX strings ----------------------------------------------------------
 def hex_str(data):
-    str = ''
-    hex = 0
-    for i in range(len(data)):
-        hex = (hex << 1) + data[i]
-        if i % 4 == 3:
-            str += '%1X' % (hex)
-            hex = 0
-    return str
+    data = np.asarray(data, dtype='uint8')
+    n = len(data) // 4
+    nib = np.packbits(data[:n * 4].reshape(n, 4), axis=1)[:, 0] >> 4
+    return HEX_CHR[nib].tobytes().decode()
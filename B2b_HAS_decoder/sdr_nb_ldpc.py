@@ -50,21 +50,15 @@ def init_table():
 
 # convert binary codes to GF(q) codes ------------------------------------------
 def bin2gf(syms):
-    n = len(syms) // N_GF
-    code = np.zeros(n, dtype='uint8')
-    for i in range(n):
-        for j in range(N_GF):
-            code[i] = (code[i] << 1) + syms[i*N_GF+j]
-    return code
+    syms = np.asarray(syms, dtype='uint8')
+    n = syms.shape[-1] // N_GF
+    bits = syms[..., :n*N_GF].reshape(syms.shape[:-1] + (n, N_GF))
+    return np.packbits(bits, axis=-1)[..., 0] >> (8 - N_GF)
 
 # convert GF(q) codes to binary codes ------------------------------------------
 def gf2bin(code):
-    n = len(code)
-    syms = np.zeros(n * N_GF, dtype='uint8')
-    for i in range(n):
-        for j in range(N_GF):
-            syms[i*N_GF+j] = (code[i] >> (N_GF - 1 - j)) & 1
-    return syms
+    code = np.asarray(code, dtype='uint8')
+    return np.unpackbits(code[:, None], axis=1)[:, 8-N_GF:].ravel()
 
 # Tanner graph edges -----------------------------------------------------------
 def graph_edge(H_idx, H_ele):
@@ -76,102 +70,217 @@ def graph_edge(H_idx, H_ele):
             he.append(H_ele[i][j])
     return ie, je, he, len(he) # CN-index, VN-index, H_ij of edges
 
+# edges of Tanner graph nodes -------------------------------------------------
+def graph_node(node):
+    # return list of (nodes, edges of the nodes in ascending order (N x d))
+    # grouped by the node degree d
+    node = np.asarray(node)
+    idx = np.argsort(node, kind='stable')
+    nodes, ix, cnt = np.unique(node[idx], return_index=True, return_counts=True)
+    return [(nodes[cnt == d], idx[ix[cnt == d][:, None] + np.arange(d)])
+        for d in np.unique(cnt)]
+
+# other edges connected to the same node ---------------------------------------
+def graph_adj(node):
+    # return list of (edges, other edges of the same node in ascending order)
+    # grouped by the number of other edges
+    adj = []
+    for _, E in graph_node(node):
+        d = E.shape[1]
+        o = np.array([[k for k in range(d) if k != j] for j in range(d)],
+            dtype=int).reshape(d, d - 1)
+        adj.append((E.ravel(), E[:, o].reshape(-1, d - 1)))
+    return adj
+
 # initialize LLR ---------------------------------------------------------------
+LLR_NERR = np.array([[bin(i ^ j).count('1') for j in range(Q_GF)]
+    for i in range(Q_GF)]) # number of bit errors between GF(q) symbols
+
 def init_LLR(code, err_prob):
-    L = np.zeros((len(code), Q_GF), dtype='float32')
-    for i in range(len(code)):
-        for j in range(Q_GF):
-            nerr = bin(code[i] ^ j).count('1')
-            L[i][j] = -log(err_prob) * nerr
-    return L
+    return (-log(err_prob) * LLR_NERR[np.asarray(code)]).astype('float32')
 
 # parity check -----------------------------------------------------------------
 def check_parity(ie, je, he, m, code):
     s = np.zeros(m, dtype='uint8')
-    for i in range(len(ie)):
-        s[ie[i]] ^= GF_MUL[he[i]][code[je[i]]]
+    np.bitwise_xor.at(s, ie, GF_MUL[he, np.asarray(code)[je]])
     return np.all(s == 0)
 
-# permute VN->CN message -------------------------------------------------------
-def permute_V2C(h, V2C):
-    V2C_p = np.zeros(Q_GF, dtype='float32')
-    for i in range(Q_GF):
-        V2C_p[GF_MUL[h][i]] = V2C[i]
-    return V2C_p
-
-# permute CN->VN message -------------------------------------------------------
-def permute_C2V(h, C2V):
-    C2V_p = np.zeros(Q_GF, dtype='float32')
-    for i in range(Q_GF):
-        C2V_p[i] = C2V[GF_MUL[h][i]]
-    return C2V_p
-
-# extended-min-sum (EMS) of LLRs ([2]) -----------------------------------------
-def ext_min_sum(L1, L2):
-    if len(L1) == 0:
-        return L2
-    idx1 = np.argsort(L1)
-    idx2 = np.argsort(L2)
-    maxL = L1[idx1[NM_EMS-1]] + L2[idx2[NM_EMS-1]]
-    Ls = np.full(Q_GF, maxL, dtype='float32')
+# extended-min-sum (EMS) of LLRs for multiple edges (N x Q_GF) -----------------
+def ext_min_sum_v(L1, L2, idx1=None, idx2=None):
+    # idx1, idx2: np.argsort(L1|L2, axis=1)[:, :NM_EMS] if precomputed
+    N = len(L1)
+    r = np.arange(N)[:, None]
+    if idx1 is None:
+        idx1 = np.argsort(L1, axis=1)[:, :NM_EMS]
+    if idx2 is None:
+        idx2 = np.argsort(L2, axis=1)[:, :NM_EMS]
+    L1s = L1.ravel()[idx1 + r * Q_GF]
+    L2s = L2.ravel()[idx2 + r * Q_GF]
+    maxL = L1s[:, -1:] + L2s[:, -1:]
     
-    for i in idx1[:NM_EMS]:
-        for j in idx2[:NM_EMS]:
-            if L1[i] + L2[j] < Ls[i^j]:
-                Ls[i^j] = L1[i] + L2[j]
-    return Ls
+    # LLR sums of NM_EMS x NM_EMS pairs, the minimum is assigned at last
+    Lp = (L1s[:, :, None] + L2s[:, None, :]).reshape(N, -1)
+    kp = (idx1[:, :, None] ^ idx2[:, None, :]).reshape(N, -1) + r * Q_GF
+    ip = (np.argsort(-Lp, axis=1) + r * NM_EMS**2).ravel()
+    Ls = np.full((N, Q_GF), np.inf, dtype='float32')
+    Ls.ravel()[kp.ravel()[ip]] = Lp.ravel()[ip]
+    return np.minimum(Ls, maxL)
 
-# decode NB-LDPC ---------------------------------------------------------------
-def decode_NB_LDPC(H_idx, H_ele, m, n, syms):
+# NB-LDPC decoder of a code ----------------------------------------------------
+class nb_ldpc:
+    """ NB-LDPC decoder with Tanner graph and buffers compiled once """
+    
+    def __init__(self, H_idx, H_ele, m, n, err_prob=ERR_PROB):
+        init_table()
+        ie, je, he, ne = graph_edge(H_idx, H_ele)
+        self.m, self.n, self.ne = m, n, ne
+        self.ie, self.je, self.he = np.array(ie), np.array(je), np.array(he)
+        self.adj_c = graph_adj(self.ie)
+        self.adj_v = graph_adj(self.je)
+        self.node_v = graph_node(self.je)
+        # permutations by H_ij (flat index of ne x Q_GF messages)
+        self.P = GF_MUL[self.he] + np.arange(ne)[:, None] * Q_GF
+        # LLR of received GF(q) symbol i and GF(q) element j
+        self.LLR = (-log(err_prob) * LLR_NERR).astype('float32')
+        # H_ij as m x d arrays for syndrome check (regular code)
+        if len(set(len(h) for h in H_idx)) == 1:
+            self.H_idx, self.H_ele = np.array(H_idx), np.array(H_ele)
+        else:
+            self.H_idx, self.H_ele = None, None
+        self.alloc(1)
     
-    # initialze GF(q) tables
-    init_table()
+    # allocate message buffers for N frames
+    def alloc(self, N):
+        n, ne = self.n, self.ne
+        self.L   = np.zeros((N, n , Q_GF), dtype='float32')
+        self.V2C = np.zeros((N, ne, Q_GF), dtype='float32')
+        self.C2V = np.zeros((N, ne, Q_GF), dtype='float32')
+        self.Lc  = np.zeros((N, ne, Q_GF), dtype='float32')
+        self.Lv  = np.zeros((N, ne, Q_GF), dtype='float32')
     
-    # convert binary codes to GF(q) codes
-    code = bin2gf(syms)
+    # parity check of GF(q) codes (n or N x n)
+    def check(self, code):
+        if self.H_idx is None:
+            if code.ndim == 1:
+                return check_parity(self.ie, self.je, self.he, self.m, code)
+            return np.array([check_parity(self.ie, self.je, self.he, self.m, c)
+                for c in code], dtype=bool)
+        s = np.bitwise_xor.reduce(GF_MUL[self.H_ele, code[..., self.H_idx]],
+            axis=-1)
+        return ~np.any(s, axis=-1)
     
-    # Tanner graph edges
-    ie, je, he, ne = graph_edge(H_idx, H_ele)
-    V2C = np.zeros((ne, Q_GF), dtype='float32')
-    C2V = np.zeros((ne, Q_GF), dtype='float32')
+    # decode NB-LDPC
+    def decode(self, syms):
+        dec, nerr = self.decode_batch(np.asarray(syms)[None, :])
+        return dec[0], int(nerr[0])
     
-    # initialize LLR and VN->CN messages
-    L = init_LLR(code, ERR_PROB)
-    for i in range(ne):
-        V2C[i] = permute_V2C(he[i], L[je[i]])
+    # edge/node indices of N frames stacked in (N*ne x Q_GF) and (N*n x Q_GF)
+    def batch_index(self, N):
+        n, ne = self.n, self.ne
+        oe = (np.arange(N) * ne)[:, None, None]
+        on = (np.arange(N) * n)[:, None, None]
+        adj_c = [((e + oe[:, :, 0]).ravel(), (o + oe).reshape(-1, o.shape[1]))
+            for e, o in self.adj_c]
+        adj_v = [((e + oe[:, :, 0]).ravel(), (o + oe).reshape(-1, o.shape[1]))
+            for e, o in self.adj_v]
+        node_v = [((v + on[:, :, 0]).ravel(), (E + oe).reshape(-1, E.shape[1]))
+            for v, E in self.node_v]
+        P = (self.P + oe * Q_GF).ravel()
+        je = (self.je + on[:, :, 0]).ravel()
+        return adj_c, adj_v, node_v, P, je
     
-    for iter in range(MAX_ITER):
-        # parity check
-        if check_parity(ie, je, he, m, code):
-            syms_dec = gf2bin(code)
-            nerr = np.count_nonzero(syms_dec ^ syms)
-            return syms_dec[:m*N_GF], nerr
+    # decode NB-LDPC of multiple frames (N x n*N_GF)
+    def decode_batch(self, syms):
+        syms = np.asarray(syms, dtype='uint8')
+        N, m, n, ne = len(syms), self.m, self.n, self.ne
+        if len(self.L) < N:
+            self.alloc(N)
         
-        # update check nodes
-        for i in range(ne):
-            Ls = []
-            for j in range(ne):
-                if ie[i] == ie[j] and i != j:
-                    Ls = ext_min_sum(Ls, V2C[j])
-            Ls -= np.min(Ls)
-            C2V[i] = permute_C2V(he[i], Ls)
+        # convert binary codes to GF(q) codes
+        code = bin2gf(syms)
+        dec = np.zeros((N, m*N_GF), dtype='uint8')
+        nerr = np.full(N, -1, dtype=int)
         
-        # update variable nodes
-        for i in range(ne):
-            Ls = L[je[i]].copy()
-            for j in range(ne):
-                if je[i] == je[j] and i != j:
-                    Ls += C2V[j]
-            Ls -= np.min(Ls)
-            V2C[i] = permute_V2C(he[i], Ls)
+        # initialize LLR and VN->CN messages
+        L, V2C = self.L[:N], self.V2C[:N]
+        np.take(self.LLR, code, axis=0, out=L)
+        adj_c, adj_v, node_v, P, je = self.batch_index(N)
+        V2C.ravel()[P] = L.reshape(-1, Q_GF)[je].ravel()
+        act = np.arange(N) # frames under decoding
         
-        # update LLR and GF(q) codes
-        for i in range(n):
-            for j in range(ne):
-                if i == je[j]:
-                    L[i] += C2V[j]
-            L[i] -= np.min(L[i])
-            code[i] = np.argmin(L[i])
-    
-    return gf2bin(code)[:m*N_GF], -1
+        for iter in range(MAX_ITER):
+            # parity check
+            ok = self.check(code)
+            if np.any(ok):
+                for i, c in zip(act[ok], code[ok]):
+                    syms_dec = gf2bin(c)
+                    dec[i] = syms_dec[:m*N_GF]
+                    nerr[i] = np.count_nonzero(syms_dec ^ syms[i])
+                act, code = act[~ok], code[~ok]
+                if len(act) == 0:
+                    return dec, nerr
+                Na = len(act)
+                L[:Na] = L[~ok]
+                V2C[:Na] = V2C[~ok]
+                L, V2C = L[:Na], V2C[:Na]
+                adj_c, adj_v, node_v, P, je = self.batch_index(Na)
+            Na = len(act)
+            Lf, V2Cf = L.reshape(-1, Q_GF), V2C.reshape(-1, Q_GF)
+            C2Vf = self.C2V[:Na].reshape(-1, Q_GF)
+            Lc = self.Lc[:Na].reshape(-1, Q_GF)
+            Lv = self.Lv[:Na].reshape(-1, Q_GF)
+            
+            # update check nodes
+            idx = np.argsort(V2Cf, axis=1)[:, :NM_EMS]
+            for e, o in adj_c:
+                Le, idx_e = V2Cf[o[:, 0]], idx[o[:, 0]]
+                for k in range(1, o.shape[1]):
+                    Le = ext_min_sum_v(Le, V2Cf[o[:, k]], idx_e, idx[o[:, k]])
+                    idx_e = None
+                Lc[e] = Le
+            Lc -= np.min(Lc, axis=1, keepdims=True)
+            np.take(Lc, P, out=C2Vf.ravel())
+            
+            # update variable nodes
+            np.take(Lf, je, axis=0, out=Lv)
+            for e, o in adj_v:
+                for k in range(o.shape[1]):
+                    Lv[e] += C2Vf[o[:, k]]
+            Lv -= np.min(Lv, axis=1, keepdims=True)
+            V2Cf.ravel()[P] = Lv.ravel()
+            
+            # update LLR and GF(q) codes
+            for v, E in node_v:
+                for k in range(E.shape[1]):
+                    Lf[v] += C2Vf[E[:, k]]
+            Lf -= np.min(Lf, axis=1, keepdims=True)
+            code = np.argmin(L, axis=2).astype('uint8')
+        
+        for i, c in zip(act, code):
+            dec[i] = gf2bin(c)[:m*N_GF]
+        return dec, nerr
+
+NB_LDPC = {} # NB-LDPC decoders of codes
+
+# get NB-LDPC decoder of code --------------------------------------------------
+def get_NB_LDPC(H_idx, H_ele, m, n):
+    key = (id(H_idx), id(H_ele), m, n)
+    if key not in NB_LDPC or NB_LDPC[key][0] is not H_idx:
+        NB_LDPC[key] = (H_idx, nb_ldpc(H_idx, H_ele, m, n))
+    return NB_LDPC[key][1]
+
+# syndrome check of NB-LDPC code ----------------------------------------------
+def check_NB_LDPC(H_idx, H_ele, m, n, syms):
+    # syms: n*N_GF or N x n*N_GF
+    syms = np.asarray(syms)
+    if syms.shape[-1] != n * N_GF:
+        return np.zeros(syms.shape[:-1], dtype=bool)
+    return get_NB_LDPC(H_idx, H_ele, m, n).check(bin2gf(syms))
+
+# decode NB-LDPC ---------------------------------------------------------------
+def decode_NB_LDPC(H_idx, H_ele, m, n, syms):
+    return get_NB_LDPC(H_idx, H_ele, m, n).decode(syms)
 
+# decode NB-LDPC of multiple frames (N x n*N_GF) ------------------------------
+def decode_NB_LDPC_batch(H_idx, H_ele, m, n, syms):
+    return get_NB_LDPC(H_idx, H_ele, m, n).decode_batch(syms)
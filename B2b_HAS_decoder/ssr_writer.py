@@ -0,0 +1,88 @@
+"""
+module for writing the SSR orbit/clock corrections (.ssr) of encode_SP3()
+
+The epoch blocks are collected in memory and appended to the file through
+one handle per output file, instead of opening the file for every epoch.
+The buffer is flushed when its size or age exceeds the thresholds and at
+close().
+"""
+
+import time
+
+FLUSH_SIZE = 1 << 20  # bytes kept in memory before flushing
+FLUSH_INTERVAL = 60.0  # maximum age of buffered data [s]
+
+
+def ssr_block(str_time, name, clock_data, orbit_data):
+    """ text of one epoch: CLOCK and ORBIT blocks of BNC format """
+    lines = ['> CLOCK {} {}  {:4d} {} \n'.format(str_time, 0, len(clock_data), name)]
+    lines.extend(clock_data.values())
+    lines.append('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, len(orbit_data), name))
+    lines.extend(orbit_data.values())
+    return ''.join(lines)
+
+
+class ssr_writer:
+    """
+    Buffered writer of the .ssr correction files
+
+    Parameters
+    ----------
+    flush_size : int
+        size of buffered text [bytes] to flush the file
+    flush_interval : float
+        time [s] after the last flush to flush the file (0: no limit)
+    """
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fh = {}  # file name: handle
+        self.buff = {}  # file name: list of text
+        self.nbuff = {}  # file name: buffered size
+        self.tflush = {}  # file name: time of last flush
+        self.nepoch = 0
+
+    def write(self, fname, text):
+        """ append text to file fname """
+        if fname not in self.fh:
+            self.fh[fname] = open(fname, 'a')
+            self.buff[fname] = []
+            self.nbuff[fname] = 0
+            self.tflush[fname] = time.monotonic()
+        self.buff[fname].append(text)
+        self.nbuff[fname] += len(text)
+        if self.nbuff[fname] >= self.flush_size or (self.flush_interval > 0 and
+                time.monotonic()-self.tflush[fname] >= self.flush_interval):
+            self.flush(fname)
+
+    def write_epoch(self, fname, str_time, name, clock_data, orbit_data):
+        """ append the CLOCK/ORBIT blocks of one epoch to file fname """
+        self.write(fname, ssr_block(str_time, name, clock_data, orbit_data))
+        self.nepoch += 1
+
+    def flush(self, fname=None):
+        """ write the buffered text to file fname (None: all files) """
+        for f in ([fname] if fname is not None else list(self.fh)):
+            if len(self.buff[f]) > 0:
+                self.fh[f].write(''.join(self.buff[f]))
+                self.buff[f] = []
+                self.nbuff[f] = 0
+            self.fh[f].flush()
+            self.tflush[f] = time.monotonic()
+
+    def close(self):
+        """ flush and close all files """
+        self.flush()
+        for fh in self.fh.values():
+            fh.close()
+        self.fh = {}
+        self.buff = {}
+        self.nbuff = {}
+        self.tflush = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
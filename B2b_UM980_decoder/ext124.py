@@ -1,4 +1,8 @@
 # Let's extract all content that starts with #PPPB2BINFO from the file
+import os
+import time
+import numpy as np
+
 
 def extract_data_from_line1(line):
     # 将每一行按逗号分割
@@ -108,6 +112,201 @@ def extract_all_pppb2binfo_content(file_path, output_file_path):
                     output_file.write(extracted_data)
 
 
+# record formats of PPP-B2b messages 1, 2 and 4
+dtype1 = [
+    ('week', 'i4'), ('tow', 'i4'), ('prn', 'i4'), ('iodssr', 'i4'), ('iodp', 'i4'),
+    ('tod', 'i4'), ('BDS', 'U63'), ('GPS', 'U37'), ('Galileo', 'U37'), ('GLONASS', 'U37')
+]
+
+dtype2 = [
+    ('week', 'i4'), ('tow', 'i4'), ('prn', 'i4'), ('iodssr', 'i4'), ('iodp', 'i4'),
+    ('tod', 'i4'), ('satslot', 'i4', (6,)), ('iodn', 'i4', (6,)), ('Rorb', 'f8', (6,)),
+    ('Aorb', 'f8', (6,)), ('Corb', 'f8', (6,)), ('iodcorr', 'i4', (6,)), ('URAI', 'U2', (6,))
+]
+
+dtype4 = [
+    ('week', 'i4'), ('tow', 'i4'), ('prn', 'i4'), ('sub', 'i4'), ('iodssr', 'i4'), ('iodp', 'i4'),
+    ('tod', 'i4'), ('iodcorr', 'i4', (23,)), ('sc0', 'f8', (23,))
+]
+
+dtype_msg = {1: dtype1, 2: dtype2, 4: dtype4}
+
+
+def decode_pppb2binfo(content):
+    """
+    Decode the content of one #PPPB2BINFO log (after the header tag)
+
+    Returns (message type, record tuple), or (None, None) if the log is
+    incomplete or not a message type 1, 2 or 4.
+    """
+    parts = content.replace(';', ',').replace('*', ',').split(',')
+    try:
+        mt = int(parts[0].replace('A', ''))
+        head = (int(parts[4]), int(parts[5]) // 1000, int(parts[10]) - 160)
+        iodssr, iodp, tod = int(parts[11]), int(parts[12]), int(parts[13])
+        if mt == 1:
+            # 卫星掩码: BDS 63位, GPS/Galileo/GLONASS 各37位
+            hex_data = parts[14]
+            bits = bin(int(hex_data, 16))[2:].zfill(len(hex_data) * 4)
+            return mt, head + (iodssr, iodp, tod, bits[:63], bits[63:100],
+                               bits[100:137], bits[137:174])
+        elif mt == 2:
+            if len(parts) < 56:
+                return None, None
+            sat = [parts[i:i + 7] for i in range(14, 56, 7)]
+            return mt, head + (iodssr, iodp, tod,
+                               [int(p[0]) for p in sat], [int(p[1]) for p in sat],
+                               [float(p[2]) * 0.0016 for p in sat],
+                               [float(p[3]) * 0.0064 for p in sat],
+                               [float(p[4]) * 0.0064 for p in sat],
+                               [int(p[5]) for p in sat], [p[6] for p in sat])
+        elif mt == 4:
+            if len(parts) < 64:
+                return None, None
+            return mt, head + (int(parts[14]), iodssr, iodp, tod,
+                               [int(p) for p in parts[18:64:2]],
+                               [float(p) * 0.0016 for p in parts[19:64:2]])
+    except (ValueError, IndexError):
+        pass
+    return None, None
+
+
+class b2b_store:
+    """
+    Columnar store of PPP-B2b messages 1, 2 and 4
+
+    One record array per message type and an order index (message type,
+    record index) of the messages as received.  Iterating the store yields
+    the message records (np.void) in that order.
+    """
+    dtype_order = [('mt', 'u1'), ('idx', 'i4')]
+
+    def __init__(self, msg=None, order=None):
+        self.msg = {mt: np.zeros(0, dtype=dtype_msg[mt]) for mt in dtype_msg}
+        if msg is not None:
+            self.msg.update(msg)
+        self.order = np.zeros(0, dtype=self.dtype_order) if order is None \
+            else np.asarray(order, dtype=self.dtype_order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        msg = self.msg
+        for mt, i in self.order.tolist():
+            yield msg[mt][i]
+
+    def __getitem__(self, k):
+        mt, i = self.order[k]
+        return self.msg[mt][i]
+
+    def save(self, fname):
+        """ save the store to .npz file """
+        with open(fname, 'wb') as f:
+            np.savez(f, order=self.order,
+                     **{'msg%d' % mt: v for mt, v in self.msg.items()})
+
+    @staticmethod
+    def load(fname):
+        """ load the store from .npz file """
+        with np.load(fname, allow_pickle=False) as f:
+            msg = {mt: f['msg%d' % mt] for mt in dtype_msg}
+            return b2b_store(msg, f['order'])
+
+
+def read_pppb2binfo(file_path, cache=False):
+    """
+    Read the #PPPB2BINFO logs of a UM980/UM982 log file in a single pass
+
+    Returns b2b_store of the messages.  With cache=True the store is saved
+    to file_path + '.npz' and loaded from there as long as it is newer than
+    the log file.
+    """
+    file_cache = file_path + '.npz'
+    if cache and os.path.exists(file_cache) and \
+            os.path.getmtime(file_cache) >= os.path.getmtime(file_path):
+        return b2b_store.load(file_cache)
+
+    rec = {1: [], 2: [], 4: []}
+    order = []
+    with open(file_path, 'rb') as f:
+        parts = f.read().split(b'#PPPB2BINFO')[1:]
+    for part in parts:
+        end_index = part.find(b'\n')
+        if end_index != -1:
+            part = part[:end_index]
+        mt, r = decode_pppb2binfo(part.decode('ascii', errors='ignore'))
+        if mt is None:
+            continue
+        order.append((mt, len(rec[mt])))
+        rec[mt].append(r)
+    v = b2b_store({mt: np.array(rec[mt], dtype=dtype_msg[mt]) for mt in rec},
+                  order)
+    if cache:
+        v.save(file_cache)
+    return v
+
+
+class pppb2binfo_follower:
+    """
+    Incremental reader of a UM980/UM982 log file being written by a receiver
+
+    The byte offset of the last complete line read is kept, and a partial
+    trailing line is buffered until the rest of it has been written.  If the
+    file shrinks (truncated or rotated), it is read again from the start.
+    """
+
+    def __init__(self, file_path, offset=0):
+        self.file_path = file_path
+        self.offset = offset
+        self.buff = b''
+
+    def read(self):
+        """ read the messages appended since the last call, as records """
+        try:
+            size = os.path.getsize(self.file_path)
+        except OSError:
+            return []
+        if size < self.offset:
+            self.offset = 0
+            self.buff = b''
+        if size == self.offset:
+            return []
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        lines = (self.buff + data).split(b'\n')
+        self.buff = lines.pop()  # partial line
+        rec = []
+        for line in lines:
+            for part in line.split(b'#PPPB2BINFO')[1:]:
+                mt, r = decode_pppb2binfo(part.decode('ascii', errors='ignore'))
+                if mt is not None:
+                    rec.append(np.array([r], dtype=dtype_msg[mt])[0])
+        return rec
+
+    def follow(self, poll=1.0, timeout=None):
+        """
+        Generator of the messages as the file grows
+
+        The file is polled every poll seconds.  The generator stops after
+        timeout seconds without new data (timeout=None: never).
+        """
+        t_idle = 0.0
+        while True:
+            rec = self.read()
+            if len(rec) > 0:
+                t_idle = 0.0
+                yield from rec
+                continue
+            if timeout is not None and t_idle >= timeout:
+                return
+            time.sleep(poll)
+            t_idle += poll
+
+
 # # Call the function with the input and output file paths
 # input_file_path = 'D:\\cssrlib-main\\src\\cssrlib\\um982_raw_data\\log_UM982_20240319_00.txt'
 # output_file_path = 'D:\\cssrlib-main\\src\\cssrlib\\um982_raw_data\\0319.txt'
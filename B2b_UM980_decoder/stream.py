@@ -0,0 +1,210 @@
+"""
+module for real-time reception of #PPPB2BINFO logs of UM980/UM982 over TCP
+
+The stream client frames the ASCII logs from the socket, checks the CRC-32
+at the end of each log and passes the decoded records (see ext124.py) to a
+bounded queue.  The connection is re-established with exponential backoff.
+The replay server plays back a recorded log file for testing.
+"""
+
+import asyncio
+import queue
+import threading
+import zlib
+import numpy as np
+from B2b_UM980_decoder.ext124 import decode_pppb2binfo, dtype_msg
+
+TAG = b'#PPPB2BINFO'
+
+
+def crc32(data):
+    """ CRC-32 of Unicore/NovAtel ASCII logs (initial value 0, no final xor) """
+    return ~zlib.crc32(data, 0xFFFFFFFF) & 0xFFFFFFFF
+
+
+def check_crc(sentence):
+    """
+    Check the CRC of one ASCII log '#...*xxxxxxxx'
+
+    The CRC is calculated over the bytes between '#' and '*'.
+    """
+    k = sentence.rfind(b'*')
+    if k < 1 or sentence[:1] != b'#':
+        return False
+    try:
+        crc = int(sentence[k+1:k+9], 16)
+    except ValueError:
+        return False
+    return crc32(sentence[1:k]) == crc
+
+
+def decode_sentence(sentence, crc=True):
+    """ decode one #PPPB2BINFO log, returns record (np.void) or None """
+    if not sentence.startswith(TAG) or (crc and not check_crc(sentence)):
+        return None
+    mt, r = decode_pppb2binfo(sentence[len(TAG):].decode('ascii', errors='ignore'))
+    if mt is None:
+        return None
+    return np.array([r], dtype=dtype_msg[mt])[0]
+
+
+class b2b_stream_client:
+    """
+    asyncio client of the #PPPB2BINFO stream of a UM980/UM982 receiver
+
+    Parameters
+    ----------
+    host, port : str, int
+        address of the TCP server (receiver or serial-to-TCP bridge)
+    maxsize : int
+        size of the record queue.  The reception waits while the queue is
+        full, so the TCP flow control holds back the receiver.
+    crc : bool
+        check the CRC of each log
+    backoff, max_backoff : float
+        initial and maximum wait [s] before re-connecting
+    max_retry : int
+        number of connection attempts in a row without data before giving
+        up (None: never give up)
+    reconnect : bool
+        re-connect after the server closed the connection.  If False, the
+        end of stream (e.g. end of file of replay_server()) ends the queue.
+    """
+
+    def __init__(self, host, port, maxsize=256, crc=True, backoff=1.0,
+                 max_backoff=30.0, max_retry=None, reconnect=True):
+        self.host = host
+        self.port = port
+        self.queue = asyncio.Queue(maxsize)
+        self.crc = crc
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry = max_retry
+        self.reconnect = reconnect
+        self.nmsg = 0
+        self.ncrc_err = 0
+        self.nconn = 0
+
+    async def receive(self, reader):
+        """ frame the logs from the stream and put the records to the queue """
+        nrx = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                return nrx
+            for part in line.split(TAG)[1:]:
+                sentence = TAG + part.rstrip(b'\r\n')
+                if self.crc and not check_crc(sentence):
+                    self.ncrc_err += 1
+                    continue
+                r = decode_sentence(sentence, crc=False)
+                if r is None:
+                    continue
+                await self.queue.put(r)
+                self.nmsg += 1
+                nrx += 1
+
+    async def run(self):
+        """ connect and receive until max_retry is reached, None ends queue """
+        wait = self.backoff
+        nretry = 0
+        while True:
+            nrx = 0
+            eos = False
+            try:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.port)
+                self.nconn += 1
+                try:
+                    nrx = await self.receive(reader)
+                    eos = True
+                finally:
+                    writer.close()
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            if eos and not self.reconnect:
+                break
+            if nrx > 0:
+                wait = self.backoff
+                nretry = 0
+            else:
+                nretry += 1
+            if self.max_retry is not None and nretry >= self.max_retry:
+                break
+            await asyncio.sleep(wait)
+            wait = min(wait * 2, self.max_backoff)
+        await self.queue.put(None)
+
+    async def records(self):
+        """ async generator of the received records """
+        task = asyncio.ensure_future(self.run())
+        try:
+            while True:
+                r = await self.queue.get()
+                if r is None:
+                    break
+                yield r
+        finally:
+            task.cancel()
+
+    async def dispatch(self, cs, callback=None):
+        """ decode the received records by cs.decode_cssr() as they arrive """
+        async for r in self.records():
+            cs.decode_cssr(r)
+            if callback is not None:
+                callback(cs, r)
+
+
+def stream_pppb2binfo(host, port, maxsize=256, **opt):
+    """
+    Generator of the records received from the TCP stream
+
+    The asyncio client runs in a background thread, so the records can be
+    processed in the same loop as read_pppb2binfo() of a log file.
+    """
+    q = queue.Queue(maxsize)
+
+    async def main():
+        client = b2b_stream_client(host, port, maxsize, **opt)
+        async for r in client.records():
+            await asyncio.to_thread(q.put, r)
+
+    def thread():
+        try:
+            asyncio.run(main())
+        finally:
+            q.put(None)
+
+    threading.Thread(target=thread, daemon=True).start()
+    while True:
+        r = q.get()
+        if r is None:
+            return
+        yield r
+
+
+async def replay_server(file_path, host='127.0.0.1', port=0, interval=0.0,
+                        nline=1):
+    """
+    TCP server to play back a recorded UM980/UM982 log file
+
+    nline lines are sent every interval [s] to each client.  The client
+    connection is closed at the end of the file.  Returns asyncio.Server,
+    the port is server.sockets[0].getsockname()[1].
+    """
+    with open(file_path, 'rb') as f:
+        lines = f.readlines()
+
+    async def handle(reader, writer):
+        try:
+            for i in range(0, len(lines), nline):
+                writer.write(b''.join(lines[i:i+nline]))
+                await writer.drain()
+                if interval > 0:
+                    await asyncio.sleep(interval)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
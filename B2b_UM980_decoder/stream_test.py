@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+#  unit test for stream.py: client against local replay server
+#
+import sys, os, asyncio, tempfile, threading
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from B2b_UM980_decoder.stream import crc32, b2b_stream_client, replay_server, \
+    stream_pppb2binfo
+
+# message type 1 (mask) of PRN C05 with BDS C01-C06
+MASK_HEX = 'FC000000000000000' + '0'*27
+
+
+def log_line(tow, crc_err=False):
+    """ #PPPB2BINFO1A log with CRC """
+    body = b'PPPB2BINFO1A,97,GPS,FINE,2300,%d,0,0,18,0;165,1,2,%d,%s' % (
+        tow*1000, tow % 86400, MASK_HEX.encode())
+    crc = crc32(body) ^ (1 if crc_err else 0)
+    return b'#' + body + b'*%08x\r\n' % crc
+
+
+def make_log(fname):
+    """ 3 valid logs and 1 log with CRC error """
+    with open(fname, 'wb') as f:
+        f.write(log_line(345600) + log_line(345601) + log_line(345602, True) +
+                log_line(345603))
+
+
+async def run_client(fname, **opt):
+    server = await replay_server(fname)
+    port = server.sockets[0].getsockname()[1]
+    client = b2b_stream_client('127.0.0.1', port, backoff=0.01, **opt)
+    recs = [r async for r in client.records()]
+    server.close()
+    await server.wait_closed()
+    return client, recs
+
+
+def test_replay_once():
+    with tempfile.TemporaryDirectory() as d:
+        fname = os.path.join(d, 'um980.log')
+        make_log(fname)
+        client, recs = asyncio.run(asyncio.wait_for(
+            run_client(fname, max_retry=2, reconnect=False), 10.0))
+    assert len(recs) == 3
+    assert [r['tow'] for r in recs] == [345600, 345601, 345603]
+    assert recs[0]['prn'] == 5 and recs[0]['BDS'][:6] == '111111'
+    assert client.nmsg == 3 and client.ncrc_err == 1 and client.nconn == 1
+
+
+def test_stream_once():
+    with tempfile.TemporaryDirectory() as d:
+        fname = os.path.join(d, 'um980.log')
+        make_log(fname)
+
+        async def serve(port):
+            server = await replay_server(fname)
+            port.append(server.sockets[0].getsockname()[1])
+            return server
+
+        loop = asyncio.new_event_loop()
+        port = []
+        server = loop.run_until_complete(serve(port))
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        try:
+            recs = list(stream_pppb2binfo('127.0.0.1', port[0], backoff=0.01,
+                                          max_retry=2, reconnect=False))
+        finally:
+            loop.call_soon_threadsafe(server.close)
+            loop.call_soon_threadsafe(loop.stop)
+    assert len(recs) == 3
+
+
+if __name__ == '__main__':
+    test_replay_once()
+    test_stream_once()
+    print('OK')